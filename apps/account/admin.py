@@ -1,5 +1,143 @@
-from django.contrib import admin
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections, router, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Lower, Now
+from django.utils.functional import cached_property
 
+from .models import User, user_changed
+from .sweeper import process_in_chunks, soft_delete_in_chunks
+from .tasks import schedule_purge, soft_delete_accounts
 
-admin.site.register(get_user_model())
\ No newline at end of file
+
+def estimated_count(queryset):
+    """Row count of the whole table from the planner statistics, or None where there are none."""
+    db = router.db_for_read(queryset.model)
+    connection = connections[db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 until the table has been vacuumed or analyzed once.
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Avoids COUNT(*) over the whole table on every changelist page.
+
+    Unfiltered, PostgreSQL's estimate is used once it passes
+    ADMIN_COUNT_LIMIT, below that (and on other backends) the count is
+    exact. Filtered and searched lists are counted up to ADMIN_COUNT_LIMIT,
+    so pagination stops there; narrow the search to get further.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_COUNT_LIMIT
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= limit:
+                return estimate
+            return self.object_list.count()
+        return self.object_list[:limit].count()
+
+
+class UserChangeList(ChangeList):
+    def get_queryset(self, request):
+        # Only what the list shows; the change form still loads whole rows.
+        return super().get_queryset(request).only(*self.model_admin.list_columns)
+
+
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    list_columns = ('id', 'email', 'first_name', 'last_name', 'is_active', 'is_mentor', 'is_staff', 'date_joined')
+    list_display = list_columns
+    list_display_links = ('id', 'email')
+    list_filter = ('is_active', 'is_mentor', 'is_staff')
+    # Both are backed by an index, so every page is an index walk with a LIMIT.
+    ordering = ('-id',)
+    sortable_by = ('id', 'email')
+    # Search goes through get_search_results(); this only turns the search box on.
+    search_fields = ('email',)
+    search_help_text = 'Начало почты (без учета регистра) или id'
+    list_select_related = False
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ('activate', 'deactivate', 'make_mentor', 'mark_deleted')
+
+    def get_changelist(self, request, **kwargs):
+        return UserChangeList
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Its cascade would run inside the request; mark_deleted leaves that to the purge.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def delete_model(self, request, obj):
+        User.objects.soft_delete(obj.pk)
+        transaction.on_commit(schedule_purge)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        # LOWER(email) LIKE 'term%': on PostgreSQL a probe of account_user_email_prefix_idx.
+        return queryset.filter(email__lower__startswith=Lower(Value(term))), False
+
+    def bulk_update(self, request, queryset, message, stamps=None, **changes):
+        """One UPDATE per SWEEP_CHUNK_SIZE rows of the selection, skipping rows that already have the values.
+
+        ``stamps`` are written along with ``changes`` but not compared. The
+        ids of each chunk are read first so their cached profiles can be
+        dropped; a page worth of rows is a single chunk.
+        """
+        pending = queryset.exclude(**changes)
+        changes.update(stamps or {})
+
+        def update(chunk):
+            ids = list(chunk.values_list('pk', flat=True))
+            updated = User.objects.filter(pk__in=ids).update(**changes)
+            for user_id in ids:
+                user_changed(user_id)
+            return updated
+
+        updated = process_in_chunks(pending, 'admin update', update, pause=0)
+        self.message_user(request, f'{message}: {updated}', messages.SUCCESS)
+
+    @admin.action(description='Активировать выбранные учетные записи', permissions=['change'])
+    def activate(self, request, queryset):
+        self.bulk_update(
+            request, queryset, 'Активировано', stamps={'activated_at': Coalesce('activated_at', Now())}, is_active=True
+        )
+
+    @admin.action(description='Деактивировать выбранные учетные записи', permissions=['change'])
+    def deactivate(self, request, queryset):
+        self.bulk_update(request, queryset, 'Деактивировано', is_active=False)
+
+    @admin.action(description='Сделать выбранных пользователей менторами', permissions=['change'])
+    def make_mentor(self, request, queryset):
+        self.bulk_update(request, queryset, 'Назначено менторами', is_mentor=True)
+
+    @admin.action(description='Удалить выбранные учетные записи', permissions=['delete'])
+    def mark_deleted(self, request, queryset):
+        if request.POST.get('select_across') != '1':
+            marked = soft_delete_in_chunks(queryset, 'admin deletion')
+            transaction.on_commit(schedule_purge)
+            self.message_user(request, f'Удалено: {marked}', messages.SUCCESS)
+            return
+
+        # Possibly the whole table: only the ids are read here, a worker
+        # soft-deletes them SWEEP_CHUNK_SIZE at a time and schedules the purge.
+        def enqueue(chunk):
+            ids = list(chunk.values_list('pk', flat=True))
+            transaction.on_commit(lambda: soft_delete_accounts.delay(ids))
+            return len(ids)
+
+        queued = process_in_chunks(queryset.filter(deleted_at__isnull=True), 'admin deletion queue', enqueue, pause=0)
+        self.message_user(request, f'Поставлено в очередь на удаление: {queued}', messages.SUCCESS)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.account'
+
+    def ready(self):
+        from . import checks, metrics, profiling  # noqa: F401, checks registers itself
+        connection_created.connect(metrics.install_db_wrapper)
+        connection_created.connect(profiling.install_db_wrapper)
@@ -0,0 +1,147 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied, Throttled
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+from .authentication import StatelessJWTAuthentication
+from .cache import profile_cache
+from .models import ActivationCode
+from .permissions import IsMentor
+from .serializers import (
+    AsyncRestorePasswordSerializer,
+    MentorRegistrationSerialiser,
+    UserRegistrationSerializer
+)
+from .throttling import EmailThrottle, IPThrottle
+from .views import profile_response, render_profile
+
+
+User = get_user_model()
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    return JsonResponse(
+        data, status=status, headers=headers, safe=False, json_dumps_params={'ensure_ascii': False}
+    )
+
+
+class AsyncAPIView(View):
+    """Async counterpart of APIView for the I/O-bound endpoints.
+
+    DRF views are synchronous, so under ASGI every request to them holds a
+    thread for the whole DB/cache/broker wait. These views await the ORM
+    directly and reuse DRF's parsers, authentication and throttles, which
+    do no I/O of their own apart from the throttle counter.
+    """
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = []
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authenticated like the DRF views, so no CSRF check either.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[authentication() for authentication in self.authentication_classes]
+        )
+        try:
+            await self.check_throttles(request)
+            self.check_permissions(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(exc)
+
+    async def check_throttles(self, request):
+        waits = []
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            allowed = await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, self)
+            if not allowed:
+                waits.append(throttle.wait())
+        if waits:
+            raise Throttled(wait=max(waits))
+
+    def check_permissions(self, request):
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if request.successful_authenticator is None:
+                    raise NotAuthenticated()
+                raise PermissionDenied()
+
+    def handle_exception(self, exc):
+        headers = None
+        if isinstance(exc, Throttled) and exc.wait is not None:
+            headers = {'Retry-After': str(int(exc.wait))}
+        detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return json_response(detail, status=exc.status_code, headers=headers)
+
+
+class AsyncUserView(AsyncAPIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsMentor]
+
+    async def get(self, request):
+        entry = await profile_cache.aget(request.user.pk)
+        if entry is None:
+            user = await User.objects.filter(pk=request.user.pk).afirst()
+            if user is None:
+                return json_response('Зарегестрируйтесь для выполнения этого действия',
+                status=status.HTTP_404_NOT_FOUND)
+            entry = await profile_cache.aset(request.user.pk, render_profile(user, request))
+        return profile_response(request, entry)
+
+
+class AsyncRegistrationView(AsyncAPIView):
+    serializer_class = UserRegistrationSerializer
+
+    async def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        await serializer.acreate(dict(serializer.validated_data))
+        return json_response(
+            'Спасибо за регистрацию! Ссылка для активации учетной записи отправлена Вам на почту.',
+            status=status.HTTP_201_CREATED
+        )
+
+
+class AsyncMentorRegistrationView(AsyncRegistrationView):
+    serializer_class = MentorRegistrationSerialiser
+
+
+class AsyncAccountActivationView(AsyncAPIView):
+    purpose = ActivationCode.ACTIVATE
+    activated_fields = {'is_active': True}
+    message = 'Учетная запись активирована!'
+
+    async def get(self, request, activation_code):
+        user_id = await ActivationCode.objects.aredeem(activation_code, self.purpose, **self.activated_fields)
+        if user_id is None:
+            return json_response('Страница не найдена...', status=status.HTTP_404_NOT_FOUND)
+        return json_response(self.message)
+
+
+class AsyncMentorActivationView(AsyncAccountActivationView):
+    purpose = ActivationCode.MENTOR_ACTIVATE
+    activated_fields = {'is_active': True, 'is_mentor': True}
+    message = 'Учетная запись активирована! Теперь вы ментор'
+
+
+class AsyncRestorePasswordView(AsyncAPIView):
+    throttle_classes = [IPThrottle, EmailThrottle]
+    throttle_scope = f'{ActivationCode.RESTORE_PASSWORD}-mail'
+
+    async def post(self, request):
+        serializer = AsyncRestorePasswordSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        await serializer.asend_code()
+        return json_response('Код для восстановления пароля был отправлен Вам на почту.')
@@ -0,0 +1,59 @@
+import copy
+
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import models
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import metrics
+from .cache import user_cache
+from .replicas import identify
+from .tokens import USER_CLAIMS
+
+
+class TokenUser(models.TokenUser):
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+    @cached_property
+    def is_mentor(self):
+        return self.token.get('is_mentor', False)
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """Builds request.user from the token claims without touching the database.
+
+    Views that need the full row should opt into CachedUserJWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            # Issued before the claims were embedded; the client has to log in again.
+            raise InvalidToken(_('Token contained no user claims'))
+        user = super().get_user(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
+
+
+class CachedUserJWTAuthentication(JWTAuthentication):
+    """Loads the user row by primary key and keeps it for AUTH_USER_CACHE_TTL seconds."""
+
+    def get_user(self, validated_token):
+        user_id = str(validated_token.get(api_settings.USER_ID_CLAIM))
+        # The row below is read before request.user exists; a pinned user must get it from the primary.
+        identify(user_id)
+        user = user_cache.get(user_id)
+        metrics.cache_lookup(user is not None)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        # Each request gets its own instance so mutations do not leak between threads.
+        return copy.copy(user)
@@ -0,0 +1,221 @@
+"""Query budgets, latency and allocations for every route in apps.account.urls.
+
+The tests check the budgets; ``manage.py bench_routes`` also records
+p50/p95 latency and peak allocations and writes them out as JSON.
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import Client
+
+from .models import ActivationCode, User
+from .throttling import sliding_window
+from .tokens import AccessToken, RefreshToken
+
+
+PASSWORD = 'bench-password'
+EMAIL_DOMAIN = 'bench-routes.example.com'
+
+
+class StatementCounter:
+    """execute_wrapper counting statements.
+
+    Savepoints and SQLite's explicit BEGIN are left out: PostgreSQL in
+    autocommit sends neither as a separate round trip.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Fixtures:
+    """Rows the routes act on; every call hands out fresh ones so iterations do not interfere."""
+
+    def __init__(self):
+        self.counter = 0
+        self.user = self.new_user(is_mentor=True)
+
+    def new_email(self):
+        self.counter += 1
+        return f'user-{self.counter}@{EMAIL_DOMAIN}'
+
+    def new_user(self, is_active=True, **extra_fields):
+        return User.objects.create_user('Bench', self.new_email(), PASSWORD, is_active=is_active, **extra_fields)
+
+    def code(self, user, purpose):
+        return user.create_activation_code(purpose)
+
+    @staticmethod
+    def auth(user):
+        return {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+    def registration(self, **extra):
+        return {
+            'first_name': 'Bench', 'last_name': 'Bench', 'email': self.new_email(),
+            'password': PASSWORD, 'password_confirm': PASSWORD, **extra
+        }
+
+    @staticmethod
+    def cleanup():
+        User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+
+
+MENTOR_FIELDS = {'type_of_teach': 'online', 'experience': '1+', 'audience': 'no aud'}
+
+
+class Route:
+    """One URL pattern, how to build a request for it, and what it may cost.
+
+    ``prepare`` takes the Fixtures and returns (path, data, headers).
+    """
+
+    def __init__(self, pattern, method, status, max_queries, prepare):
+        self.pattern = pattern
+        self.method = method
+        self.status = status
+        self.max_queries = max_queries
+        self.prepare = prepare
+
+    @property
+    def name(self):
+        return f'{self.method.upper()} /account/{self.pattern}'
+
+
+def activation(prefix, purpose):
+    def prepare(fixtures):
+        code = fixtures.code(fixtures.new_user(is_active=False), purpose)
+        return f'/account/{prefix}{code}/', None, {}
+    return prepare
+
+
+def email_change(fixtures):
+    user, new_email = fixtures.new_user(), fixtures.new_email()
+    data = {
+        'old_email': user.email, 'new_email': new_email, 'new_email_confirm': new_email,
+        'code': fixtures.code(user, ActivationCode.CHANGE_EMAIL)
+    }
+    return '/account/set-new-email/', data, {}
+
+
+ROUTES = [
+    Route('register/', 'post', 201, 2, lambda f: ('/account/register/', f.registration(), {})),
+    Route('mentor-register/', 'post', 201, 2,
+          lambda f: ('/account/mentor-register/', f.registration(**MENTOR_FIELDS), {})),
+    Route('activate/<str:activation_code>/', 'get', 200, 2, activation('activate/', ActivationCode.ACTIVATE)),
+    Route('mentor-activate/<str:activation_code>/', 'get', 200, 2,
+          activation('mentor-activate/', ActivationCode.MENTOR_ACTIVATE)),
+    Route('login/', 'post', 200, 1,
+          lambda f: ('/account/login/', {'email': f.user.email, 'password': PASSWORD}, {})),
+    Route('token/refresh/', 'post', 200, 1,
+          lambda f: ('/account/token/refresh/', {'refresh': str(RefreshToken.for_user(f.user))}, {})),
+    Route('logout/', 'post', 200, 0,
+          lambda f: ('/account/logout/', {'refresh': str(RefreshToken.for_user(f.user))}, {})),
+    Route('change-password/', 'post', 200, 2, lambda f: (
+        '/account/change-password/',
+        {'old_password': PASSWORD, 'new_password': PASSWORD, 'new_pass_confirm': PASSWORD},
+        f.auth(f.user)
+    )),
+    Route('restore-password/', 'post', 200, 3,
+          lambda f: ('/account/restore-password/', {'email': f.user.email}, {})),
+    Route('set-restored-password/', 'post', 200, 4, lambda f: (
+        '/account/set-restored-password/',
+        {
+            'email': f.user.email, 'code': f.code(f.user, ActivationCode.RESTORE_PASSWORD),
+            'new_password': PASSWORD, 'new_pass_confirm': PASSWORD
+        },
+        {}
+    )),
+    Route('delete-account/', 'delete', 204, 2,
+          lambda f: ('/account/delete-account/', None, f.auth(f.new_user()))),
+    Route('user/', 'get', 200, 1, lambda f: ('/account/user/', None, f.auth(f.user))),
+    Route('mentors/', 'get', 200, 1, lambda f: ('/account/mentors/', None, {})),
+    Route('update-first_last-name/<str:email>/', 'patch', 200, 2, lambda f: (
+        f'/account/update-first_last-name/{f.user.email}/',
+        {'first_name': 'Bench', 'last_name': 'Bench'},
+        f.auth(f.user)
+    )),
+    Route('update-email/', 'post', 200, 3, lambda f: ('/account/update-email/', {'email': f.user.email}, {})),
+    Route('set-new-email/', 'post', 200, 3, email_change),
+    Route('async/register/', 'post', 201, 2, lambda f: ('/account/async/register/', f.registration(), {})),
+    Route('async/mentor-register/', 'post', 201, 2,
+          lambda f: ('/account/async/mentor-register/', f.registration(**MENTOR_FIELDS), {})),
+    Route('async/activate/<str:activation_code>/', 'get', 200, 2,
+          activation('async/activate/', ActivationCode.ACTIVATE)),
+    Route('async/mentor-activate/<str:activation_code>/', 'get', 200, 2,
+          activation('async/mentor-activate/', ActivationCode.MENTOR_ACTIVATE)),
+    Route('async/restore-password/', 'post', 200, 2,
+          lambda f: ('/account/async/restore-password/', {'email': f.user.email}, {})),
+    Route('async/user/', 'get', 200, 1, lambda f: ('/account/async/user/', None, f.auth(f.user))),
+]
+
+
+def send(client, route, fixtures):
+    path, data, headers = route.prepare(fixtures)
+    return send_prepared(client, route, path, data, headers)
+
+
+def send_prepared(client, route, path, data, headers):
+    # Throttles still run, they are only kept from tripping over repeated requests.
+    sliding_window.clear()
+    counter = StatementCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        if data is None:
+            response = getattr(client, route.method)(path, headers=headers)
+        else:
+            response = getattr(client, route.method)(path, data, content_type='application/json', headers=headers)
+        elapsed = time.perf_counter() - start
+    if response.status_code != route.status:
+        raise AssertionError(f'{route.name} answered {response.status_code}, expected {route.status}')
+    return elapsed, counter.count
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_route(route, fixtures, iterations, allocation_iterations=0):
+    client = Client()
+    # Warm-up: imports, compiled templates and the profile cache.
+    send(client, route, fixtures)
+    timings, queries = [], []
+    for _ in range(iterations):
+        elapsed, count = send(client, route, fixtures)
+        timings.append(elapsed)
+        queries.append(count)
+    result = {
+        'route': route.name,
+        'status': route.status,
+        'queries': max(queries),
+        'max_queries': route.max_queries,
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+    }
+    if allocation_iterations:
+        # A separate pass, tracing would skew the timings above.
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(allocation_iterations):
+                request = route.prepare(fixtures)
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                send_prepared(client, route, *request)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+        result['alloc_peak_kib'] = round(statistics.median(peaks) / 1024, 1)
+    return result
+
+
+def run_routes(iterations, allocation_iterations=0, routes=ROUTES):
+    fixtures = Fixtures()
+    return [run_route(route, fixtures, iterations, allocation_iterations) for route in routes]
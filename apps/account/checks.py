@@ -0,0 +1,151 @@
+"""System checks describing where cached state lives.
+
+log_topology() logs, once per server process, which backend holds the
+Django cache, the sessions, the profile cache, the throttle windows, the
+token revocations and the replica pins. The warnings flag layouts that
+only work with one process, and persistent database connections under ASGI.
+"""
+import logging
+from urllib.parse import urlsplit
+
+import redis
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+CACHE_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+logger = logging.getLogger(__name__)
+
+
+def redact(url):
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    netloc = parts.netloc.replace(f':{parts.password}@', ':***@')
+    return parts._replace(netloc=netloc).geturl()
+
+
+def describe_cache(alias):
+    config = settings.CACHES[alias]
+    backend = config['BACKEND'].rsplit('.', 1)[-1]
+    if config['BACKEND'] in PER_PROCESS_BACKENDS:
+        return f"cache '{alias}': {backend}, per process"
+    locations = config.get('LOCATION', '')
+    if isinstance(locations, str):
+        locations = locations.split(',')
+    options = config.get('OPTIONS', {})
+    serializer = options.get('serializer')
+    details = [', '.join(redact(location) for location in locations)]
+    if serializer:
+        details.append(f'serializer {serializer.rsplit(".", 1)[-1]}')
+        if serializer == 'apps.account.cache.CacheSerializer':
+            details.append(f'zlib from {settings.CACHE_COMPRESS_MIN_BYTES} bytes')
+    if 'max_connections' in options:
+        details.append(f'pool of {options["max_connections"]} per process')
+    return f"cache '{alias}': {backend} at {'; '.join(details)}"
+
+
+def describe_sessions():
+    engine = settings.SESSION_ENGINE
+    if engine in CACHE_SESSION_ENGINES:
+        return f"sessions: {engine.rsplit('.', 1)[-1]} in cache '{settings.SESSION_CACHE_ALIAS}'"
+    return f"sessions: {engine.rsplit('.', 1)[-1]}"
+
+
+def redis_location():
+    return redact(settings.REDIS_URL) if settings.REDIS_URL else None
+
+
+def topology():
+    shared = redis_location()
+    lines = [describe_cache(alias) for alias in settings.CACHES]
+    lines.append(describe_sessions())
+    lines.append(
+        f'profile cache: local LRU ({settings.PROFILE_CACHE_SIZE} entries, {settings.PROFILE_CACHE_LOCAL_TTL}s)'
+        + (f' + Redis at {shared} ({settings.PROFILE_CACHE_TTL}s)' if shared else ', per process')
+    )
+    lines.append(f'throttles: Redis at {shared}' if shared else 'throttles: per process')
+    lines.append(
+        f'token revocations: bloom filter ({settings.TOKEN_REVOCATION_CAPACITY} entries) per process'
+        + (f' + Redis at {shared}, synced every {settings.TOKEN_REVOCATION_SYNC_INTERVAL}s' if shared else '')
+    )
+    if settings.DATABASE_REPLICAS:
+        lines.append(f'replica pins: {settings.REPLICA_STICKINESS}s, ' + (f'Redis at {shared}' if shared else 'per process'))
+    return lines
+
+
+def log_topology():
+    """Called by config/wsgi.py and config/asgi.py, so management commands stay quiet."""
+    logger.info('Cache topology:\n  %s', '\n  '.join(topology()))
+
+
+@checks.register(checks.Tags.caches)
+def check_cache_topology(app_configs, **kwargs):
+    if settings.DEBUG:
+        return []
+    messages = []
+    if settings.CACHES['default']['BACKEND'] in PER_PROCESS_BACKENDS:
+        messages.append(checks.Warning(
+            'The default cache is per process, so workers do not share cached values.',
+            hint='Set CACHE_URL (or REDIS_URL) to a Redis instance.',
+            id='account.W001',
+        ))
+    session_cache = settings.CACHES.get(settings.SESSION_CACHE_ALIAS, {})
+    if settings.SESSION_ENGINE in CACHE_SESSION_ENGINES and session_cache.get('BACKEND') in PER_PROCESS_BACKENDS:
+        messages.append(checks.Warning(
+            'Sessions are kept in a per-process cache and are lost between workers and restarts.',
+            hint='Use a shared cache or SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies.',
+            id='account.W002',
+        ))
+    if not settings.REDIS_URL:
+        messages.append(checks.Warning(
+            'REDIS_URL is empty: profile cache entries and throttle windows are per process.',
+            id='account.W003',
+        ))
+    return messages
+
+
+@checks.register(checks.Tags.database)
+def check_asgi_connections(app_configs, **kwargs):
+    """Under ASGI, sync code runs on executor threads whose connections Django never closes."""
+    if not settings.ASGI:
+        return []
+    return [
+        checks.Warning(
+            f"Database '{alias}' keeps connections for {database['CONN_MAX_AGE']}s under ASGI; "
+            'every executor thread holds one open until it dies.',
+            hint='Set DB_CONN_MAX_AGE=0, or put PgBouncer in front and set DB_PGBOUNCER=True.',
+            id='account.W004',
+        )
+        for alias, database in settings.DATABASES.items()
+        if database.get('CONN_MAX_AGE') != 0 and not database.get('DISABLE_SERVER_SIDE_CURSORS')
+    ]
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_cache_reachable(app_configs, **kwargs):
+    """Only under ``check --deploy``: a round trip to every Redis the caches use."""
+    messages = []
+    for alias, config in settings.CACHES.items():
+        if config['BACKEND'] == 'django.core.cache.backends.redis.RedisCache':
+            try:
+                caches[alias].get('account:check')
+            except redis.RedisError as error:
+                messages.append(checks.Error(f"Cache '{alias}' is unreachable: {error}", id='account.E001'))
+    if settings.REDIS_URL:
+        try:
+            redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1).ping()
+        except redis.RedisError as error:
+            messages.append(checks.Error(
+                f'Redis at {redact(settings.REDIS_URL)} is unreachable: {error}', id='account.E002'
+            ))
+    return messages
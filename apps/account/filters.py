@@ -0,0 +1,20 @@
+import django_filters
+from django.db.models import Q, Value
+from django.db.models.functions import Lower
+
+from .models import User
+
+
+class MentorFilter(django_filters.FilterSet):
+    """Equality filters on the choice fields, each backed by an account_mentor_*_idx index."""
+    name = django_filters.CharFilter(method='filter_name', label='Начало имени или фамилии')
+
+    class Meta:
+        model = User
+        fields = ('type_of_teach', 'experience', 'audience')
+
+    def filter_name(self, queryset, name, value):
+        # LOWER(first_name) LIKE 'value%' OR the same on last_name: on PostgreSQL
+        # each side is a probe of account_mentor_{first,last}_name_idx.
+        prefix = Lower(Value(value.strip()))
+        return queryset.filter(Q(first_name__lower__startswith=prefix) | Q(last_name__lower__startswith=prefix))
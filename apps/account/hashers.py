@@ -0,0 +1,104 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from . import metrics
+
+
+class TimedHasherMixin:
+    """Reports the time spent in encode() and verify() to the request metrics."""
+
+    def encode(self, *args, **kwargs):
+        metrics.hashing_started()
+        try:
+            return super().encode(*args, **kwargs)
+        finally:
+            metrics.hashing_finished()
+
+    def verify(self, *args, **kwargs):
+        metrics.hashing_started()
+        try:
+            return super().verify(*args, **kwargs)
+        finally:
+            metrics.hashing_finished()
+
+
+# Cost parameters are read from settings on every call, so changing them in
+# the environment makes check_password() rehash stored passwords on the next
+# successful login.
+
+class PBKDF2PasswordHasher(TimedHasherMixin, hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(TimedHasherMixin, hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(TimedHasherMixin, hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.SCRYPT_WORK_FACTOR
+
+    @property
+    def maxmem(self):
+        # OpenSSL refuses more than 32 MiB by default, which rules out N > 2**14.
+        return 2 * 128 * self.work_factor * self.block_size
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASHING_WORKERS,
+            thread_name_prefix='password-hashing'
+        )
+    return _executor
+
+
+def run_in_pool(func, *args):
+    # run_in_executor() does not carry context variables over, the request metrics need them.
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(get_executor(), functools.partial(contextvars.copy_context().run, func, *args))
+
+
+async def amake_password(password):
+    return await run_in_pool(hashers.make_password, password)
+
+
+async def acheck_password(user, password):
+    """Async counterpart of ``user.check_password``.
+
+    Only the hashing runs in the pool; the rehash-on-login write is done by
+    the caller's connection with ``asave`` instead of from a pool thread.
+    """
+    must_update = []
+    is_correct = await run_in_pool(hashers.check_password, password, user.password, must_update.append)
+    if must_update:
+        user.password = await amake_password(password)
+        await user.asave(update_fields=['password'])
+    return is_correct
+
+
+def make_passwords(passwords):
+    """Hash a batch of passwords; used as a process pool job by import_users."""
+    return [hashers.make_password(password) for password in passwords]
@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from apps.account.authentication import StatelessJWTAuthentication
+from apps.account.models import User
+from apps.account.tokens import AccessToken
+from apps.account.views import UserView
+
+
+MODES = [
+    # (label, authentication class, USER_ID_FIELD)
+    ('row by first_name (before)', JWTAuthentication, 'first_name'),
+    ('row by primary key', JWTAuthentication, 'id'),
+    ('stateless claims', StatelessJWTAuthentication, 'id'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measures authenticated requests per second on /account/user/ for each JWT authentication mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000, help='Rows in the user table during the run')
+        parser.add_argument('--requests', type=int, default=2_000)
+
+    @override_settings(REDIS_URL='', PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def handle(self, *args, **options):
+        original_classes = UserView.authentication_classes
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(first_name=f'bench{i}', email=f'bench-auth-{i}@example.com')
+                for i in range(options['users'])
+            )
+            user = User.objects.create_user(
+                'bench-auth-user', 'bench-auth-user@example.com', 'password', is_active=True, is_mentor=True
+            )
+            try:
+                for label, authentication_class, user_id_field in MODES:
+                    with override_settings(SIMPLE_JWT={**settings.SIMPLE_JWT, 'USER_ID_FIELD': user_id_field}):
+                        UserView.authentication_classes = [authentication_class]
+                        self.run_mode(label, user, options['requests'])
+            finally:
+                UserView.authentication_classes = original_classes
+                transaction.set_rollback(True)
+
+    def run_mode(self, label, user, requests):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        # Warm up the profile cache so only authentication differs between modes.
+        assert client.get('/account/user/').status_code == 200
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                client.get('/account/user/')
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{label:<28} {requests / elapsed:8.0f} req/s  {len(queries) / requests:.2f} queries/request'
+        )
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from apps.account.models import User
+
+
+MODES = [
+    # (label, settings_dict overrides; None keeps DATABASES['default'] as configured)
+    ('new connection per request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+    ('persistent', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': False}),
+    ('persistent + health checks', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}),
+    ('as configured', None),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measures per-request database connection overhead with and without persistent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2_000)
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        configured = dict(connection.settings_dict)
+        opened = []
+
+        def count_connection(sender, **kwargs):
+            opened.append(1)
+
+        connection_created.connect(count_connection)
+        try:
+            for label, overrides in MODES:
+                connection.close()
+                connection.settings_dict.clear()
+                connection.settings_dict.update(configured, **(overrides or {}))
+                opened.clear()
+                start = time.perf_counter()
+                for _ in range(requests):
+                    # The same signals the request handler sends, so Django's own
+                    # close_old_connections() decides when to reconnect.
+                    request_started.send(sender=self.__class__)
+                    # The primary-key lookup the auth endpoints make.
+                    User.objects.filter(pk=0).exists()
+                    request_finished.send(sender=self.__class__)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{label:<28} {elapsed / requests * 1_000_000:8.1f} us/request  '
+                    f'{len(opened)} connections opened'
+                )
+        finally:
+            connection_created.disconnect(count_connection)
+            connection.close()
+            connection.settings_dict.clear()
+            connection.settings_dict.update(configured)
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from apps.account.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+
+
+COSTS = {
+    'pbkdf2': (
+        PBKDF2PasswordHasher,
+        [{'PBKDF2_ITERATIONS': iterations} for iterations in (260_000, 390_000, 600_000)]
+    ),
+    'argon2': (
+        Argon2PasswordHasher,
+        [
+            {'ARGON2_TIME_COST': 2, 'ARGON2_MEMORY_COST': 19_456, 'ARGON2_PARALLELISM': 1},
+            {'ARGON2_TIME_COST': 3, 'ARGON2_MEMORY_COST': 65_536, 'ARGON2_PARALLELISM': 1},
+            {'ARGON2_TIME_COST': 2, 'ARGON2_MEMORY_COST': 102_400, 'ARGON2_PARALLELISM': 8},
+        ]
+    ),
+    'scrypt': (
+        ScryptPasswordHasher,
+        [{'SCRYPT_WORK_FACTOR': 2 ** power} for power in (14, 15)]
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Reports single-threaded hashes per second for every hasher and cost setting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', choices=COSTS, action='append')
+        parser.add_argument('--seconds', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        for name in options['hasher'] or COSTS:
+            hasher_class, costs = COSTS[name]
+            for cost in costs:
+                params = ' '.join(f'{key}={value}' for key, value in cost.items())
+                with override_settings(**cost):
+                    try:
+                        rate = self.measure(hasher_class(), options['seconds'])
+                    except ValueError as e:
+                        # Missing optional library or parameters the backend rejects.
+                        self.stdout.write(f'{name:<8} {params:<70} skipped: {e}')
+                        continue
+                self.stdout.write(f'{name:<8} {params:<70} {rate:8.1f} hashes/s per core')
+
+    def measure(self, hasher, seconds):
+        hashes = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        while True:
+            hasher.encode('correct horse battery staple', hasher.salt())
+            hashes += 1
+            now = time.perf_counter()
+            if now >= deadline:
+                return hashes / (now - start)
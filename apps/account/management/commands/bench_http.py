@@ -0,0 +1,97 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.account.models import User
+from apps.account.tokens import AccessToken
+
+
+BENCH_EMAIL = 'bench-http@example.com'
+
+# (label, path on the WSGI stack, path on the ASGI stack)
+ROUTES = [
+    ('profile', '/account/user/', '/account/async/user/'),
+    ('activation miss', '/account/activate/{}/', '/account/async/activate/{}/'),
+]
+
+
+async def request(reader, writer, host, path, headers):
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}', *(f'{name}: {value}' for name, value in headers.items())]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    response_headers = dict(line.split(': ', 1) for line in header_lines if line)
+    response_headers = {name.lower(): value for name, value in response_headers.items()}
+    await reader.readexactly(int(response_headers.get('content-length', 0)))
+    return int(status_line.split()[1]), response_headers.get('connection', '').lower() == 'close'
+
+
+async def connection_worker(url, path, headers, counter, latencies, statuses):
+    parts = urlsplit(url)
+    reader = writer = None
+    try:
+        while counter[0] > 0:
+            counter[0] -= 1
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            start = time.perf_counter()
+            status, close = await request(reader, writer, parts.netloc, path.format(counter[0]), headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if close:
+                # Sync WSGI workers (gunicorn) close after every response.
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def load(url, path, headers, concurrency, requests):
+    counter, latencies, statuses = [requests], [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        connection_worker(url, path, headers, counter, latencies, statuses) for _ in range(concurrency)
+    ))
+    return time.perf_counter() - start, latencies, statuses
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares concurrent-connection throughput of the sync views on a WSGI server with the async '
+        'views on an ASGI server, e.g. `gunicorn config.wsgi -w 4 -b :8001` against '
+        '`uvicorn config.asgi:application --workers 4 --port 8002`'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', help='Base URL of the WSGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--asgi', help='Base URL of the ASGI server, e.g. http://127.0.0.1:8002')
+        parser.add_argument('--concurrency', type=int, default=100, help='Open connections')
+        parser.add_argument('--requests', type=int, default=5_000, help='Requests per route and server')
+
+    def handle(self, *args, **options):
+        targets = [(name, options[name]) for name in ('wsgi', 'asgi') if options[name]]
+        if not targets:
+            raise CommandError('Pass --wsgi and/or --asgi')
+        # The servers run in other processes, so the user has to be committed.
+        user, _ = User.objects.get_or_create(
+            email=BENCH_EMAIL, defaults={'first_name': 'bench-http', 'is_active': True, 'is_mentor': True}
+        )
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        for label, wsgi_path, asgi_path in ROUTES:
+            for name, url in targets:
+                path = wsgi_path if name == 'wsgi' else asgi_path
+                elapsed, latencies, statuses = asyncio.run(
+                    load(url.rstrip('/'), path, headers, options['concurrency'], options['requests'])
+                )
+                latencies.sort()
+                self.stdout.write(
+                    f'{label:<16} {name}  {len(latencies) / elapsed:8.0f} req/s'
+                    f'  p50 {statistics.median(latencies) * 1000:6.1f} ms'
+                    f'  p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:6.1f} ms'
+                    f'  statuses {statuses}'
+                )
@@ -0,0 +1,107 @@
+import socketserver
+import threading
+import time
+
+from django.core import mail
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+
+from apps.account.tasks import ACTIVATION_LINK, send_activation_mails
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept mail, with a fixed delay standing in for TCP/TLS/auth setup."""
+
+    def handle(self):
+        time.sleep(self.server.handshake_delay)
+        self.wfile.write(b'220 localhost stand-in ESMTP\r\n')
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b'DATA':
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                with self.server.lock:
+                    self.server.received += 1
+                self.wfile.write(b'250 OK\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, handshake_delay):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.handshake_delay = handshake_delay
+        self.lock = threading.Lock()
+        self.received = 0
+
+
+def send_one_by_one(mails):
+    # What send_activation_code did before batching: render and connect per mail.
+    for email, activation_link in mails:
+        send_mail(
+            'Activate your account!',
+            '',
+            'bench@example.com',
+            [email],
+            html_message=render_to_string('account/code_mail.html', {'activation_link': activation_link}),
+            fail_silently=False
+        )
+
+
+class Command(BaseCommand):
+    help = 'Compares per-message activation mails with batched delivery over one connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mails', type=int, default=500)
+        parser.add_argument('--backend', choices=['smtp', 'locmem'], default='smtp')
+        parser.add_argument('--handshake-ms', type=float, default=20.0, help='Simulated connection setup cost')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        mails = [
+            (f'bench{i}@example.com', ACTIVATION_LINK.format(f'code{i:04}'))
+            for i in range(options['mails'])
+        ]
+        batch_size = options['batch_size']
+
+        def send_batched(mails):
+            for start in range(0, len(mails), batch_size):
+                send_activation_mails(mails[start:start + batch_size])
+
+        email_settings = {'EMAIL_HOST_USER': 'bench@example.com', 'EMAIL_HOST_PASSWORD': ''}
+        server = None
+        if options['backend'] == 'smtp':
+            server = StandInSMTPServer(options['handshake_ms'] / 1000)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            email_settings.update(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST='127.0.0.1',
+                EMAIL_PORT=server.server_address[1],
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+            )
+        else:
+            email_settings['EMAIL_BACKEND'] = 'django.core.mail.backends.locmem.EmailBackend'
+
+        try:
+            with override_settings(**email_settings):
+                for name, send in (('one by one', send_one_by_one), ('batched', send_batched)):
+                    mail.outbox = []
+                    start = time.perf_counter()
+                    send(mails)
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(f'{name:<12} {len(mails) / elapsed:10.1f} mails/s  ({elapsed:.2f}s)')
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                self.stdout.write(f'stand-in server accepted {server.received} mails')
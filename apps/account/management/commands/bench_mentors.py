@@ -0,0 +1,80 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.pagination import Cursor, LimitOffsetPagination
+
+from apps.account.models import User
+from apps.account.pagination import MentorCursorPagination
+from apps.account.views import MentorListView
+
+
+EMAIL_DOMAIN = 'bench-mentors.example.com'
+PATH = '/account/mentors/'
+TYPES = ['privat', 'professional', 'online', 'other']
+
+
+class Command(BaseCommand):
+    help = 'Times mentor directory pages deep into a large table with keyset and with OFFSET pagination'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mentors', type=int, default=200_000)
+        parser.add_argument('--pages', default='1,100,1000,10000', help='Comma-separated page numbers')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--filter', default='', help='Query string applied to every page, e.g. type_of_teach=online')
+
+    def handle(self, *args, **options):
+        self.create_mentors(options['mentors'])
+        try:
+            self.run(options)
+        finally:
+            User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+
+    def create_mentors(self, count):
+        batch = []
+        for i in range(count):
+            batch.append(User(
+                email=f'mentor-{i}@{EMAIL_DOMAIN}', first_name=f'Mentor{i}', last_name='Bench', password='!',
+                is_active=True, is_mentor=True, type_of_teach=TYPES[i % 4], experience='1+', audience='no aud'
+            ))
+            if len(batch) == 5_000:
+                User.objects.bulk_create(batch)
+                batch = []
+        User.objects.bulk_create(batch)
+
+    def run(self, options):
+        factory = RequestFactory()
+        keyset_view = MentorListView.as_view()
+        offset_view = MentorListView.as_view(pagination_class=LimitOffsetPagination)
+        page_size = MentorCursorPagination.page_size
+        query = dict(pair.split('=', 1) for pair in options['filter'].split('&') if pair)
+        mentors = User.objects.listed_mentors().filter(**query).order_by('id')
+        total = mentors.count()
+
+        self.stdout.write(f'{"page":>8} {"keyset ms":>10} {"offset ms":>10}')
+        for page in map(int, options['pages'].split(',')):
+            offset = (page - 1) * page_size
+            if offset + page_size > total:
+                self.stdout.write(f'{page:>8} past the last page of {total} mentors')
+                continue
+            # The last id of the previous page, as the cursor of the "next" link would carry it.
+            position = mentors.values_list('id', flat=True)[offset - 1] if offset else None
+            paginator = MentorCursorPagination()
+            paginator.base_url = PATH
+            keyset_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+            timings = {'keyset': [], 'offset': []}
+            for _ in range(options['repeat']):
+                for label, view, request in (
+                    ('keyset', keyset_view, factory.get(keyset_url, query)),
+                    ('offset', offset_view, factory.get(PATH, {**query, 'limit': page_size, 'offset': offset})),
+                ):
+                    start = time.perf_counter()
+                    response = view(request)
+                    response.render()
+                    timings[label].append(time.perf_counter() - start)
+                    assert len(response.data['results']) == page_size, (label, page)
+            self.stdout.write(
+                f'{page:>8} {statistics.median(timings["keyset"]) * 1000:>10.2f} '
+                f'{statistics.median(timings["offset"]) * 1000:>10.2f}'
+            )
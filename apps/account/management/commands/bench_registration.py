@@ -0,0 +1,87 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from apps.account.models import ActivationCode, User
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+        self.savepoints = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = sql.lstrip().upper()
+        if statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            self.savepoints += 1
+        else:
+            self.queries += 1
+            if statement.startswith(('INSERT', 'UPDATE', 'DELETE')):
+                self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def issue_after_probe(user, purpose):
+    """The old way to issue a code, for comparison: probe the table for a clash, then INSERT."""
+    while True:
+        code = get_random_string(length=ActivationCode.CODE_LENGTH)
+        code_hash = ActivationCode.hash_code(code)
+        if not ActivationCode.objects.filter(code_hash=code_hash).exists():
+            break
+    ActivationCode.objects.create(
+        user=user, purpose=purpose, code_hash=code_hash, expires_at=timezone.now() + settings.ACTIVATION_CODE_LIFETIME
+    )
+    return code
+
+
+def issue(user, purpose):
+    return ActivationCode.objects.issue(user, purpose)
+
+
+class Command(BaseCommand):
+    help = (
+        'Registers users inside a rolled back transaction, issuing codes the old way (exists() then '
+        'create()) and the current way, and reports queries and time per registration for both'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+
+    # Hashing is swapped for a cheap hasher so the numbers reflect DB round trips only.
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def handle(self, *args, **options):
+        users = options['users']
+        before, before_elapsed = self.register(users, issue_after_probe)
+        after, after_elapsed = self.register(users, issue)
+
+        self.stdout.write(f'users:                       {users}')
+        self.stdout.write(f'{"":29}{"before":>10}{"after":>10}')
+        self.stdout.write(f'queries per registration:    {before.queries / users:>10.2f}{after.queries / users:>10.2f}')
+        self.stdout.write(f'writes per registration:     {before.writes / users:>10.2f}{after.writes / users:>10.2f}')
+        # Savepoints only appear because the benchmark runs in a transaction it can roll back.
+        self.stdout.write(
+            f'savepoints per registration: {before.savepoints / users:>10.2f}{after.savepoints / users:>10.2f}'
+        )
+        self.stdout.write(f'registrations per second:    {users / before_elapsed:>10.0f}{users / after_elapsed:>10.0f}')
+
+    @staticmethod
+    def register(users, issue_code):
+        """Register ``users`` accounts with ``issue_code``, rolled back; returns the counter and the seconds."""
+        counter = QueryCounter()
+        with transaction.atomic():
+            start = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                for i in range(users):
+                    user = User.objects.create_user(
+                        f'bench{i}', f'bench-registration-{i}@example.com', 'password'
+                    )
+                    issue_code(user, ActivationCode.ACTIVATE)
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return counter, elapsed
@@ -0,0 +1,61 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from apps.account.benchmarks import Fixtures, run_routes
+from config.celery import app
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives every account route and writes query counts, p50/p95 latency and peak allocations '
+        'as JSON; fails if a route goes over its query budget. Runs against a throwaway test '
+        'database, never the configured one'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per route')
+        parser.add_argument('--allocation-iterations', type=int, default=20, help='Traced requests per route')
+        parser.add_argument('--output', help='Write the JSON here instead of stdout')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database between runs')
+
+    @override_settings(
+        REDIS_URL='',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    )
+    def handle(self, *args, **options):
+        # The bench creates and deletes accounts: it gets its own database, created
+        # and dropped like the one of manage.py test; replicas mirror it there.
+        old_config = setup_databases(verbosity=options['verbosity'], interactive=False, keepdb=options['keepdb'])
+        # Autocommit rather than a rolled back transaction, so on_commit mail tasks run
+        # as in production; the bench rows are deleted afterwards.
+        task_always_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        try:
+            results = run_routes(options['iterations'], options['allocation_iterations'])
+        except AssertionError as exc:
+            raise CommandError(str(exc))
+        finally:
+            app.conf.task_always_eager = task_always_eager
+            Fixtures.cleanup()
+            teardown_databases(old_config, verbosity=options['verbosity'], keepdb=options['keepdb'])
+
+        report = json.dumps({
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'routes': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        over_budget = [result['route'] for result in results if result['queries'] > result['max_queries']]
+        if over_budget:
+            raise CommandError(f'Over the query budget: {", ".join(over_budget)}')
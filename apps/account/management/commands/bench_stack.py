@@ -0,0 +1,87 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter per sample, so imports and app loading are really cold.
+WORKER = r'''
+import io, json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from config.wsgi import application
+loaded = time.perf_counter()
+
+from apps.account.cache import profile_cache
+from apps.account.models import User
+from apps.account.tokens import AccessToken
+
+# A cached profile: the request crosses every middleware and DRF, but not the database.
+user = User(pk=1, email='bench-stack@example.com', first_name='Bench', is_active=True, is_mentor=True)
+profile_cache.local.set('1', ('"bench"', b'{}'))
+environ = {'PATH_INFO': '/account/user/', 'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+setup_testing_defaults(environ)
+
+def request():
+    statuses = []
+    b''.join(application(dict(environ, **{'wsgi.input': io.BytesIO()}), lambda status, headers: statuses.append(status)))
+    assert statuses[0].startswith('200'), statuses[0]
+
+first_start = time.perf_counter()
+request()
+first = time.perf_counter()
+timings = []
+for _ in range(int(sys.argv[1])):
+    started = time.perf_counter()
+    request()
+    timings.append(time.perf_counter() - started)
+timings.sort()
+print(json.dumps({
+    'startup_ms': (loaded - start) * 1000,
+    'first_request_ms': (first - first_start) * 1000,
+    'request_us': timings[len(timings) // 2] * 1_000_000,
+}))
+'''
+
+PROFILES = [
+    ('full', {'API_ONLY': 'False'}),
+    ('api-only', {'API_ONLY': 'True'}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compares worker cold start and per-request overhead of the full and the API_ONLY settings profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=5, help='Fresh worker processes per profile')
+        parser.add_argument('--requests', type=int, default=2_000, help='Timed requests per worker')
+
+    def sample(self, overrides, requests):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings', 'REDIS_URL': '', **overrides}
+        result = subprocess.run(
+            [sys.executable, '-c', WORKER, str(requests)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return json.loads(result.stdout)
+
+    def handle(self, *args, **options):
+        samples = {label: [] for label, _ in PROFILES}
+        # Interleaved, so a noisy moment on the machine hits both profiles alike.
+        for _ in range(options['samples']):
+            for label, overrides in PROFILES:
+                samples[label].append(self.sample(overrides, options['requests']))
+        report = {
+            label: {
+                field: round(statistics.median(sample[field] for sample in runs), 1)
+                for field in ('startup_ms', 'first_request_ms', 'request_us')
+            }
+            for label, runs in samples.items()
+        }
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from apps.account.hashers import make_passwords
+from apps.account.models import ActivationCode, User
+from apps.account.tasks import send_activation_codes
+
+
+def read_rows(path, file_format):
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+class Command(BaseCommand):
+    help = 'Streams users from a CSV or JSONL file into the database in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=None, help='Processes used for password hashing')
+        parser.add_argument('--method', choices=['auto', 'copy', 'bulk'], default='auto')
+        parser.add_argument('--mentors', action='store_true', help='Send mentor activation links')
+        parser.add_argument('--email-chunk-size', type=int, default=100)
+        parser.add_argument('--no-emails', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if connection.vendor == 'postgresql' else 'bulk'
+        elif method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('COPY is only available on PostgreSQL')
+        purpose = ActivationCode.MENTOR_ACTIVATE if options['mentors'] else ActivationCode.ACTIVATE
+
+        workers = options['workers'] or os.cpu_count() or 1
+
+        imported = skipped = 0
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch in batched(read_rows(path, file_format), options['batch_size']):
+                users = self.build_users(batch, pool, workers)
+                new_users = self.exclude_existing(users)
+                skipped += len(batch) - len(new_users)
+                if new_users:
+                    with transaction.atomic():
+                        if method == 'copy':
+                            self.copy_users(new_users)
+                        else:
+                            User.objects.bulk_create(new_users)
+                        self.fill_ids(new_users)
+                        recipients = self.create_codes(new_users, purpose)
+                    if not options['no_emails']:
+                        for chunk in batched(recipients, options['email_chunk_size']):
+                            send_activation_codes.delay(chunk, mentor=options['mentors'])
+                imported += len(new_users)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{imported} imported, {skipped} skipped, {imported / elapsed:.0f} rows/s'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {imported} users imported, {skipped} skipped in {time.perf_counter() - start:.1f}s'
+        ))
+
+    def build_users(self, batch, pool, workers):
+        rows = {}
+        for row in batch:
+            email = row.get('email')
+            if email and row.get('first_name'):
+                email = User.objects.normalize_email(email)
+                # Addresses differing only in case are one account, see account_user_email_ci_uniq.
+                rows.setdefault(email.lower(), (email, row))
+        # One pool job per worker keeps pickling overhead to a few messages per batch.
+        passwords = [row.get('password') or None for _, row in rows.values()]
+        chunk_size = max(1, -(-len(passwords) // workers))
+        hashed = [
+            password
+            for chunk in pool.map(make_passwords, batched(passwords, chunk_size))
+            for password in chunk
+        ]
+        return [
+            User(
+                email=email,
+                first_name=row['first_name'],
+                last_name=row.get('last_name') or '',
+                type_of_teach=row.get('type_of_teach') or None,
+                experience=row.get('experience') or None,
+                audience=row.get('audience') or None,
+                password=password,
+            )
+            for (email, row), password in zip(rows.values(), hashed)
+        ]
+
+    def exclude_existing(self, users):
+        existing = set(
+            User.objects.filter(email__lower__in=[user.email.lower() for user in users])
+            .values_list(Lower('email'), flat=True)
+        )
+        return [user for user in users if user.email.lower() not in existing]
+
+    def copy_users(self, users):
+        fields = [field for field in User._meta.concrete_fields if not field.primary_key]
+        quote_name = connection.ops.quote_name
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            quote_name(User._meta.db_table),
+            ', '.join(quote_name(field.column) for field in fields)
+        )
+        buffer = io.StringIO()
+        for user in users:
+            buffer.write('\t'.join(
+                copy_value(field.get_db_prep_save(getattr(user, field.attname), connection))
+                for field in fields
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, 'copy_expert'):
+                raw_cursor.copy_expert(sql, buffer)
+            else:
+                with raw_cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    def fill_ids(self, users):
+        # COPY (and bulk_create on backends without RETURNING) leave pk unset.
+        if all(user.pk for user in users):
+            return
+        ids = dict(
+            User.objects.filter(email__in=[user.email for user in users])
+            .values_list('email', 'id')
+        )
+        for user in users:
+            user.pk = ids[user.email]
+
+    def create_codes(self, users, purpose):
+        expires_at = timezone.now() + settings.ACTIVATION_CODE_LIFETIME
+        codes = [get_random_string(length=ActivationCode.CODE_LENGTH) for _ in users]
+        ActivationCode.objects.bulk_create([
+            ActivationCode(
+                user_id=user.pk,
+                purpose=purpose,
+                code_hash=ActivationCode.hash_code(code),
+                expires_at=expires_at
+            )
+            for user, code in zip(users, codes)
+        ])
+        return [(user.email, code) for user, code in zip(users, codes)]
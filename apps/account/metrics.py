@@ -0,0 +1,360 @@
+"""Per-view request metrics in the Prometheus text format.
+
+Each thread accumulates into its own shard, so recording takes no lock;
+a scrape sums the shards. While a request runs, its counters live in a
+small RequestStats struct reachable through a context variable, which
+also follows the request into sync_to_async and hashing-pool threads.
+
+Account deletion and sweep counters are the exception: purges and sweeps
+run in Celery workers, so the counters are kept in Redis and every web
+process reports the same totals (aggregate them with max(), not sum()).
+
+The endpoint is off unless METRICS_ENABLED is set and only answers
+addresses in METRICS_ALLOWED_IPS.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+from .redis_client import get_redis
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = '<unmatched>'
+DELETION_COUNTERS_KEY = 'account:deletion-metrics'
+
+current_request = ContextVar('account_metrics_request', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'cache_hits', 'cache_misses', 'hashing_seconds', 'hashing_depth', 'hashing_started')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.hashing_seconds = 0.0
+        self.hashing_depth = 0
+        self.hashing_started = 0.0
+
+
+class ViewStats:
+    __slots__ = ('buckets', 'count', 'seconds', 'queries', 'db_seconds', 'cache_hits', 'cache_misses', 'hashing_seconds')
+
+    def __init__(self):
+        # One slot per bucket plus +Inf; made cumulative when rendered.
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.hashing_seconds = 0.0
+
+    def add(self, elapsed, stats):
+        self.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        self.count += 1
+        self.seconds += elapsed
+        self.queries += stats.queries
+        self.db_seconds += stats.db_seconds
+        self.cache_hits += stats.cache_hits
+        self.cache_misses += stats.cache_misses
+        self.hashing_seconds += stats.hashing_seconds
+
+    def merge(self, other):
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        for field in self.__slots__[1:]:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            # Once per thread; only this registration is locked.
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def record(self, view, elapsed, stats):
+        shard = self.shard()
+        view_stats = shard.get(view)
+        if view_stats is None:
+            view_stats = shard[view] = ViewStats()
+        view_stats.add(elapsed, stats)
+
+    def collect(self):
+        totals = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # list() copies under the GIL, so a thread adding a view cannot break the iteration.
+            for view, view_stats in list(shard.items()):
+                totals.setdefault(view, ViewStats()).merge(view_stats)
+        return totals
+
+    def clear(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+registry = Registry()
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver adding db_execute_wrapper to every connection once."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        # At the front: connection.execute_wrapper() pops the last wrapper on exit.
+        connection.execute_wrappers.insert(0, db_execute_wrapper)
+
+
+def cache_lookup(hit):
+    stats = current_request.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def hashing_started():
+    stats = current_request.get()
+    if stats is not None:
+        # PBKDF2's verify() calls encode(); only the outer call is timed.
+        stats.hashing_depth += 1
+        if stats.hashing_depth == 1:
+            stats.hashing_started = time.perf_counter()
+
+
+def hashing_finished():
+    stats = current_request.get()
+    if stats is not None:
+        stats.hashing_depth -= 1
+        if not stats.hashing_depth:
+            stats.hashing_seconds += time.perf_counter() - stats.hashing_started
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else UNMATCHED
+
+
+class MetricsMiddleware:
+    """Times every request and files it, with its DB, cache and hashing counters, under the view name.
+
+    Keep it first in MIDDLEWARE so the other middleware is timed as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            registry.record(view_name(request), time.perf_counter() - start, stats)
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            registry.record(view_name(request), time.perf_counter() - start, stats)
+            current_request.reset(token)
+
+
+METRICS = [
+    # (name, type, help, ViewStats field)
+    ('db_queries_total', 'counter', 'Database statements executed.', 'queries'),
+    ('db_query_duration_seconds_total', 'counter', 'Time spent executing database statements.', 'db_seconds'),
+    ('cache_hits_total', 'counter', 'Profile and user cache hits.', 'cache_hits'),
+    ('cache_misses_total', 'counter', 'Profile and user cache misses.', 'cache_misses'),
+    ('password_hashing_seconds_total', 'counter', 'Time spent hashing and verifying passwords.', 'hashing_seconds'),
+]
+
+
+class DeletionCounters:
+    """Totals of soft deletions, purges and sweeps, in a Redis hash or, without Redis, in this process."""
+
+    def __init__(self):
+        self._local = defaultdict(float)
+        self._lock = threading.Lock()
+        self._pending = None
+        self._pending_at = float('-inf')
+
+    def add(self, **amounts):
+        client = get_redis()
+        if client is not None:
+            try:
+                with client.pipeline(transaction=False) as pipe:
+                    for field, amount in amounts.items():
+                        pipe.hincrbyfloat(DELETION_COUNTERS_KEY, field, amount)
+                    pipe.execute()
+                return
+            except redis.RedisError:
+                pass
+        with self._lock:
+            for field, amount in amounts.items():
+                self._local[field] += amount
+
+    def totals(self):
+        with self._lock:
+            totals = dict(self._local)
+        client = get_redis()
+        if client is not None:
+            try:
+                for field, amount in client.hgetall(DELETION_COUNTERS_KEY).items():
+                    field = field.decode()
+                    totals[field] = totals.get(field, 0) + float(amount)
+            except redis.RedisError:
+                pass
+        return totals
+
+    def pending(self):
+        """Accounts marked deleted and not purged yet, counted at most every METRICS_PENDING_TTL seconds."""
+        from .models import User
+
+        now = time.monotonic()
+        if now - self._pending_at >= settings.METRICS_PENDING_TTL:
+            # A probe of account_user_deleted_idx, which holds only these rows.
+            self._pending = User.objects.filter(deleted_at__isnull=False).count()
+            self._pending_at = now
+        return self._pending
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self._pending_at = float('-inf')
+
+
+deletion_counters = DeletionCounters()
+
+
+def count_deletions(**amounts):
+    """Add to the deletion counters: marked=, purge_runs=, purge_seconds= or purged_<model label>=."""
+    deletion_counters.add(**amounts)
+
+
+def count_sweeps(**amounts):
+    """Add to the sweep counters: sweep_runs=, sweep_seconds= or swept_<kind>= as chunks commit."""
+    deletion_counters.add(**amounts)
+
+
+def render_deletions(totals):
+    lines = [
+        '# HELP account_deletions_total Accounts marked deleted.',
+        '# TYPE account_deletions_total counter',
+        f'account_deletions_total {int(totals.get("marked", 0))}',
+        '# HELP account_deletions_pending Accounts marked deleted and not purged yet.',
+        '# TYPE account_deletions_pending gauge',
+        f'account_deletions_pending {deletion_counters.pending()}',
+        '# HELP account_purge_runs_total Runs of purge_deleted_accounts.',
+        '# TYPE account_purge_runs_total counter',
+        f'account_purge_runs_total {int(totals.get("purge_runs", 0))}',
+        '# HELP account_purge_duration_seconds_total Time spent purging deleted accounts.',
+        '# TYPE account_purge_duration_seconds_total counter',
+        f'account_purge_duration_seconds_total {totals.get("purge_seconds", 0)}',
+        '# HELP account_purged_rows_total Rows removed by the purge, by model.',
+        '# TYPE account_purged_rows_total counter',
+    ]
+    for field, amount in sorted(totals.items()):
+        if field.startswith('purged_'):
+            lines.append(f'account_purged_rows_total{{model="{escape(field[len("purged_"):])}"}} {int(amount)}')
+    return lines
+
+
+def render_sweeps(totals):
+    lines = [
+        '# HELP account_sweep_runs_total Runs of sweep_stale_accounts.',
+        '# TYPE account_sweep_runs_total counter',
+        f'account_sweep_runs_total {int(totals.get("sweep_runs", 0))}',
+        '# HELP account_sweep_duration_seconds_total Time spent sweeping stale accounts and codes.',
+        '# TYPE account_sweep_duration_seconds_total counter',
+        f'account_sweep_duration_seconds_total {totals.get("sweep_seconds", 0)}',
+        '# HELP account_swept_rows_total Rows removed by the sweep, by kind; grows chunk by chunk during a run.',
+        '# TYPE account_swept_rows_total counter',
+    ]
+    for field, amount in sorted(totals.items()):
+        if field.startswith('swept_'):
+            lines.append(f'account_swept_rows_total{{kind="{escape(field[len("swept_"):])}"}} {int(amount)}')
+    return lines
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    totals = sorted(registry.collect().items())
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by view.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for view, view_stats in totals:
+        label = f'view="{escape(view)}"'
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), view_stats.buckets):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{{label}}} {view_stats.seconds}')
+        lines.append(f'http_request_duration_seconds_count{{{label}}} {view_stats.count}')
+    for name, metric_type, help_text, field in METRICS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for view, view_stats in totals:
+            lines.append(f'{name}{{view="{escape(view)}"}} {getattr(view_stats, field)}')
+    job_totals = deletion_counters.totals()
+    lines.extend(render_deletions(job_totals))
+    lines.extend(render_sweeps(job_totals))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
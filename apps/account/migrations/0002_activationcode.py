@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='activation_code',
+        ),
+        migrations.CreateModel(
+            name='ActivationCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('activate', 'Активация учетной записи'), ('mentor-activate', 'Активация учетной записи ментора'), ('restore-password', 'Восстановление пароля'), ('change-email', 'Изменение почты')], max_length=20)),
+                ('code_hash', models.CharField(max_length=64, unique=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activation_codes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Код активации',
+                'verbose_name_plural': 'Коды активации',
+            },
+        ),
+    ]
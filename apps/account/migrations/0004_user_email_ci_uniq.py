@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:30
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def check_case_duplicates(apps, schema_editor):
+    # Accounts differing only in email case have to be merged by hand before the index can be built.
+    User = apps.get_model('account', 'User')
+    duplicates = list(
+        User.objects.using(schema_editor.connection.alias)
+        .values(lowered=django.db.models.functions.text.Lower('email'))
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+        .values_list('lowered', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(f'Emails registered more than once in different case: {", ".join(duplicates)}')
+
+
+CONSTRAINT = models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='account_user_email_ci_uniq')
+
+
+def create_ci_index(apps, schema_editor):
+    # On PostgreSQL the constraint is a unique index; building it CONCURRENTLY keeps signups
+    # and email changes writable meanwhile. A failed build leaves an INVALID index behind,
+    # which is dropped before trying again.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {CONSTRAINT.name}')
+        schema_editor.execute(f'CREATE UNIQUE INDEX CONCURRENTLY {CONSTRAINT.name} ON account_user (LOWER(email))')
+    else:
+        schema_editor.add_constraint(apps.get_model('account', 'User'), CONSTRAINT)
+
+
+def drop_ci_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {CONSTRAINT.name}')
+    else:
+        schema_editor.remove_constraint(apps.get_model('account', 'User'), CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('account', '0003_user_date_joined'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_case_duplicates, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(create_ci_index, drop_ci_index)],
+            state_operations=[migrations.AddConstraint(model_name='user', constraint=CONSTRAINT)],
+        ),
+    ]
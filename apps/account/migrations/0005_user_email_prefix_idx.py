@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+INDEX = 'account_user_email_prefix_idx'
+
+
+def create_prefix_index(apps, schema_editor):
+    # text_pattern_ops lets LIKE 'prefix%' use the index under any collation;
+    # Index(opclasses=...) cannot express it on LOWER(email) portably, so it is PostgreSQL-only.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX} ON account_user (LOWER(email) text_pattern_ops)'
+        )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX}')
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY cannot run inside a transaction; the table stays writable while the index builds.
+    atomic = False
+
+    dependencies = [
+        ('account', '0004_user_email_ci_uniq'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+from apps.account.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0005_user_email_prefix_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_mentor', True)), fields=['id'], name='account_mentor_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_mentor', True)), fields=['type_of_teach', 'id'], name='account_mentor_teach_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_mentor', True)), fields=['experience', 'id'], name='account_mentor_exp_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_mentor', True)), fields=['audience', 'id'], name='account_mentor_aud_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_mentor', True)), fields=['type_of_teach', 'experience', 'audience', 'id'], name='account_mentor_all_idx'),
+        ),
+    ]
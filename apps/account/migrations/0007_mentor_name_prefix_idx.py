@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+INDEXES = {
+    'account_mentor_first_name_idx': 'first_name',
+    'account_mentor_last_name_idx': 'last_name',
+}
+
+
+def create_name_indexes(apps, schema_editor):
+    # Name-prefix search of the mentor directory, see 0005 for why this is raw SQL.
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, column in INDEXES.items():
+            schema_editor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON account_user (LOWER({column}) text_pattern_ops) '
+                'WHERE is_mentor AND is_active'
+            )
+
+
+def drop_name_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name in INDEXES:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0006_mentor_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_indexes, drop_name_indexes),
+    ]
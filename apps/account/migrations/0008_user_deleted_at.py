@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+from apps.account.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0007_mentor_name_prefix_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['id'], name='account_user_deleted_idx'),
+        ),
+    ]
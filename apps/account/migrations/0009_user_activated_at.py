@@ -0,0 +1,39 @@
+from django.db import migrations, models, transaction
+
+
+CHUNK_SIZE = 10_000
+
+
+def backfill_activated_at(apps, schema_editor):
+    # The activation time was not recorded before; accounts that are active or ever
+    # logged in count as activated when they joined, so the sweeper leaves them alone.
+    # Walked in pk ranges, one short transaction each, so no long lock on account_user.
+    User = apps.get_model('account', 'User')
+    alias = schema_editor.connection.alias
+    users = User.objects.using(alias)
+    bounds = users.aggregate(first=models.Min('pk'), last=models.Max('pk'))
+    if bounds['first'] is None:
+        return
+    activated = models.Q(is_active=True) | models.Q(is_staff=True) | models.Q(last_login__isnull=False)
+    for start in range(bounds['first'], bounds['last'] + 1, CHUNK_SIZE):
+        with transaction.atomic(using=alias):
+            users.filter(
+                activated, pk__gte=start, pk__lt=start + CHUNK_SIZE, activated_at__isnull=True
+            ).update(activated_at=models.F('date_joined'))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0008_user_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='activated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_activated_at, migrations.RunPython.noop, elidable=True),
+    ]
@@ -1,11 +1,52 @@
-from django.db import models
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
-from django.utils.crypto import get_random_string
+from django.utils import timezone
+from django.utils.crypto import get_random_string, salted_hmac
 from django.core.exceptions import ValidationError
 
+from . import metrics
+from .cache import profile_cache, user_cache
+from .replicas import pin_user
+from .revocation import revocations
+
+
+# email__lower, first_name__lower...: the expression the case-insensitive indexes are built on.
+models.CharField.register_lookup(Lower)
+
+
+def email_lookup(email, prefix=''):
+    """Filter kwargs matching ``email`` in any letter case with one probe of account_user_email_ci_uniq.
+
+    Both sides go through the database's LOWER(), so they are folded the same way.
+    """
+    return {f'{prefix}email__lower': Lower(Value(email))}
+
+
+# The rows the public mentor directory lists.
+LISTED_MENTORS = models.Q(is_mentor=True, is_active=True)
+
+
+def user_changed(user_id):
+    """Drop cached copies of the user's row and keep their reads off the replicas for a while."""
+    profile_cache.invalidate(user_id)
+    user_cache.delete(str(user_id))
+    pin_user(user_id)
+
+
+def accounts_deleted(user_ids):
+    """Refuse the refresh tokens of accounts just marked deleted and count them."""
+    revocations.revoke_users(user_ids)
+    metrics.count_deletions(marked=len(user_ids))
+
 
 class UserManager(BaseUserManager):
-    def _create(self, first_name, email, password, **extra_fields):
+    def _create(self, first_name, email, password, hashed=False, **extra_fields):
         if not first_name:
             raise ValueError('User must have username')
         if not email:
@@ -15,7 +56,11 @@ class UserManager(BaseUserManager):
             email=self.normalize_email(email),
             **extra_fields
         )
-        user.set_password(password)
+        # hashed=True: the caller already ran make_password, e.g. on the async hashing pool.
+        if hashed:
+            user.password = password
+        else:
+            user.set_password(password)
         user.save(using=self._db)
         return user
 
@@ -29,6 +74,42 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_active', True)
         return self._create(first_name, email, password, **extra_fields)
 
+    def with_email(self, email):
+        """The user with ``email``, whatever the letter case; every email lookup goes through here.
+
+        Accounts marked deleted are left out: they can no longer log in or get codes mailed.
+        """
+        return self.filter(**email_lookup(email), deleted_at__isnull=True)
+
+    def get_by_natural_key(self, email):
+        # Login matches the address in any case, like the other lookups.
+        return self.with_email(email).get()
+
+    def listed_mentors(self):
+        return self.filter(LISTED_MENTORS)
+
+    def soft_delete(self, user_id):
+        """Mark the account deleted and inactive with one UPDATE; purge_deleted_accounts removes the rows later.
+
+        Its activation codes are deleted in the same transaction, so a code mailed
+        earlier cannot reactivate the account or change its password meanwhile.
+        """
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            marked = self.filter(pk=user_id, deleted_at__isnull=True).update(is_active=False, deleted_at=timezone.now())
+            if marked:
+                ActivationCode.objects.filter(user_id=user_id).delete()
+        if marked:
+            user_changed(user_id)
+            accounts_deleted([user_id])
+        return bool(marked)
+
+    def unactivated(self, joined_before):
+        """Accounts that were never activated and are older than ``joined_before``.
+
+        activated_at tells them apart from accounts deactivated later on, e.g. by an admin.
+        """
+        return self.filter(is_active=False, activated_at__isnull=True, is_staff=False, date_joined__lt=joined_before)
+
 
 class User(AbstractBaseUser):
     TYPE_CHOICES = [
@@ -56,7 +137,11 @@ class User(AbstractBaseUser):
     is_mentor = models.BooleanField(default=False)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
-    activation_code = models.CharField(max_length=8, blank=True)
+    date_joined = models.DateTimeField(default=timezone.now, editable=False)
+    # First activation; accounts without it are removed by the sweeper once UNACTIVATED_ACCOUNT_TTL passes.
+    activated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Set by soft_delete(); the row then only waits for purge_deleted_accounts.
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     objects = UserManager()
 
@@ -75,17 +160,212 @@ class User(AbstractBaseUser):
     def save(self,*args, **kwargs):
         if not self.first_name:
             raise ValidationError('Поле имени не может быть пустым!')
+        created = self._state.adding
+        if self.is_active and self.activated_at is None:
+            self.activated_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'activated_at'}
         super().save(*args, **kwargs)
+        if not created:
+            user_changed(self.pk)
 
-    def create_activation_code(self):
-        code = get_random_string(length=8)
-        if User.objects.filter(activation_code=code).exists():
-            self.create_activation_code()
-        self.activation_code = code
-        self.save()
+    def create_activation_code(self, purpose):
+        return ActivationCode.objects.issue(self, purpose)
 
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            # Walked in id order by the sweeper; only covers the (few) inactive rows.
+            models.Index(fields=['id'], condition=models.Q(is_active=False), name='account_user_inactive_idx'),
+            # Walked in id order by the purge; only accounts waiting for it are indexed.
+            models.Index(fields=['id'], condition=models.Q(deleted_at__isnull=False), name='account_user_deleted_idx'),
+            # Mentor directory (MentorListView): each filter is an equality seek followed by an id
+            # range in id order, whatever the page; only listed mentors are indexed.
+            models.Index(fields=['id'], condition=LISTED_MENTORS, name='account_mentor_idx'),
+            models.Index(fields=['type_of_teach', 'id'], condition=LISTED_MENTORS, name='account_mentor_teach_idx'),
+            models.Index(fields=['experience', 'id'], condition=LISTED_MENTORS, name='account_mentor_exp_idx'),
+            models.Index(fields=['audience', 'id'], condition=LISTED_MENTORS, name='account_mentor_aud_idx'),
+            models.Index(
+                fields=['type_of_teach', 'experience', 'audience', 'id'], condition=LISTED_MENTORS,
+                name='account_mentor_all_idx'
+            ),
+        ]
+        constraints = [
+            # One account per address in any letter case. email keeps unique=True as well,
+            # since Django requires USERNAME_FIELD to be unique on its own.
+            models.UniqueConstraint(Lower('email'), name='account_user_email_ci_uniq'),
+        ]
+
+
+class ActivationCodeManager(models.Manager):
+    def valid(self, code, purpose):
+        return self.filter(
+            code_hash=ActivationCode.hash_code(code),
+            purpose=purpose,
+            expires_at__gt=timezone.now()
+        )
+
+    def issue(self, user, purpose):
+        """Store a fresh code for ``user`` and return it in plain text.
+
+        Uniqueness is left to the index on ``code_hash``: with 62**8 possible
+        codes a clash is rare enough that retrying the INSERT is cheaper than
+        probing the table before every write.
+        """
+        expires_at = timezone.now() + settings.ACTIVATION_CODE_LIFETIME
+        # A failed INSERT only poisons an enclosing transaction, so the
+        # savepoint round trips are paid only when there is one.
+        db = router.db_for_write(self.model)
+        in_atomic_block = transaction.get_connection(db).in_atomic_block
+        for attempt in range(ActivationCode.ISSUE_ATTEMPTS):
+            code = get_random_string(length=ActivationCode.CODE_LENGTH)
+            try:
+                with transaction.atomic(using=db) if in_atomic_block else nullcontext():
+                    self.create(
+                        user=user,
+                        purpose=purpose,
+                        code_hash=ActivationCode.hash_code(code),
+                        expires_at=expires_at
+                    )
+            except IntegrityError:
+                if attempt == ActivationCode.ISSUE_ATTEMPTS - 1:
+                    raise
+                continue
+            return code
+
+    async def aissue(self, user, purpose):
+        # No enclosing transaction in async code, so a clash needs no savepoint.
+        expires_at = timezone.now() + settings.ACTIVATION_CODE_LIFETIME
+        for attempt in range(ActivationCode.ISSUE_ATTEMPTS):
+            code = get_random_string(length=ActivationCode.CODE_LENGTH)
+            try:
+                await self.acreate(
+                    user=user,
+                    purpose=purpose,
+                    code_hash=ActivationCode.hash_code(code),
+                    expires_at=expires_at
+                )
+            except IntegrityError:
+                if attempt == ActivationCode.ISSUE_ATTEMPTS - 1:
+                    raise
+                continue
+            return code
+
+    def _spendable(self, code, purpose, owner):
+        codes = self.valid(code, purpose).filter(user__deleted_at__isnull=True)
+        if owner:
+            codes = codes.filter(**{f'user__{lookup}': value for lookup, value in owner.items()})
+        return codes
+
+    def is_spendable(self, code, purpose, owner=None):
+        """Whether redeem() would accept the code right now, read from the primary."""
+        return self._spendable(code, purpose, owner).using(router.db_for_write(self.model)).exists()
+
+    def redeem(self, code, purpose, owner=None, **changes):
+        """Spend a live code, write ``changes`` onto its owner and return the owner's id, or None.
+
+        ``owner`` holds extra lookups on the user, e.g. ``email_lookup(email)``.
+        Deleting the code is what makes it single-use: of two requests racing
+        on the same code only one gets the row back. On PostgreSQL the DELETE
+        ... RETURNING feeds the UPDATE ... RETURNING in a single statement;
+        elsewhere both run in one transaction.
+        """
+        if purpose in ActivationCode.ACTIVATING:
+            changes.setdefault('activated_at', timezone.now())
+        # Manager.db is the read alias; every statement here belongs on the primary.
+        db = router.db_for_write(self.model)
+        codes = self._spendable(code, purpose, owner).using(db)
+        connection = connections[db]
+        if connection.vendor == 'postgresql' and changes:
+            sql, params = self._redeem_sql(codes, connection, changes)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            user_id = row[0] if row else None
+        else:
+            with transaction.atomic(using=db):
+                user_id = self._spend(codes, connection)
+                if user_id is not None and changes:
+                    User.objects.using(db).filter(pk=user_id).update(**changes)
+        if user_id is not None:
+            user_changed(user_id)
+        return user_id
+
+    async def aredeem(self, code, purpose, owner=None, **changes):
+        # Raw cursors have no async API yet, so the statement runs on a database thread.
+        return await sync_to_async(self.redeem)(code, purpose, owner, **changes)
+
+    def _delete_sql(self, codes, connection):
+        qn = connection.ops.quote_name
+        subquery, params = codes.values('pk').query.get_compiler(connection=connection).as_sql()
+        sql = (
+            f'DELETE FROM {qn(self.model._meta.db_table)} WHERE {qn(self.model._meta.pk.column)} IN ({subquery}) '
+            f'RETURNING {qn(self.model._meta.get_field("user").column)}'
+        )
+        return sql, params
+
+    def _redeem_sql(self, codes, connection, changes):
+        qn = connection.ops.quote_name
+        delete_sql, params = self._delete_sql(codes, connection)
+        fields = [User._meta.get_field(name) for name in changes]
+        table, pk = qn(User._meta.db_table), qn(User._meta.pk.column)
+        assignments = ', '.join(f'{qn(field.column)} = %s' for field in fields)
+        sql = (
+            f'WITH spent AS ({delete_sql}) '
+            f'UPDATE {table} SET {assignments} FROM spent '
+            f'WHERE {table}.{pk} = spent.{qn(self.model._meta.get_field("user").column)} '
+            f'RETURNING {table}.{pk}'
+        )
+        return sql, (*params, *(field.get_db_prep_save(changes[field.name], connection) for field in fields))
+
+    def _spend(self, codes, connection):
+        if connection.features.can_return_columns_from_insert:
+            # SQLite >= 3.35 and MariaDB accept RETURNING on DELETE as well.
+            sql, params = self._delete_sql(codes, connection)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            return row[0] if row else None
+        activation = codes.only('pk', 'user_id').first()
+        if activation is None or not self.filter(pk=activation.pk).delete()[0]:
+            return None
+        return activation.user_id
+
+
+class ActivationCode(models.Model):
+    ACTIVATE = 'activate'
+    MENTOR_ACTIVATE = 'mentor-activate'
+    RESTORE_PASSWORD = 'restore-password'
+    CHANGE_EMAIL = 'change-email'
+    PURPOSE_CHOICES = [
+        (ACTIVATE, 'Активация учетной записи'),
+        (MENTOR_ACTIVATE, 'Активация учетной записи ментора'),
+        (RESTORE_PASSWORD, 'Восстановление пароля'),
+        (CHANGE_EMAIL, 'Изменение почты')
+    ]
+    # Redeeming these stamps User.activated_at.
+    ACTIVATING = (ACTIVATE, MENTOR_ACTIVATE)
+    CODE_LENGTH = 8
+    ISSUE_ATTEMPTS = 3
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activation_codes')
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    code_hash = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ActivationCodeManager()
+
+    @staticmethod
+    def hash_code(code):
+        return salted_hmac('account.ActivationCode', code, algorithm='sha256').hexdigest()
+
+    def __str__(self) -> str:
+        return f'{self.purpose} ({self.user_id})'
+
+    class Meta:
+        verbose_name = 'Код активации'
+        verbose_name_plural = 'Коды активации'
 
 
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MentorCursorPagination(CursorPagination):
+    """Keyset pagination on id: each page is ``WHERE id > <last id> ORDER BY id LIMIT n``.
+
+    Unlike OFFSET, no page walks past the rows of the pages before it, so
+    page 10,000 costs the same as page 1, and there is no COUNT(*).
+    """
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -6,6 +6,6 @@ class IsOwner(BasePermission):
     
 class IsMentor(BasePermission):
     def has_permission(self, request, view):
-        if request.user.is_mentor == True:
-            return True
+        # Read from the token claims, so no database query is needed.
+        return bool(getattr(request.user, 'is_mentor', False))
         
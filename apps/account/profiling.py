@@ -0,0 +1,187 @@
+"""Development-time query inspection: N+1 patterns, unindexed filters and slow statements.
+
+An Inspection is attached to the ORM through an execute_wrapper and
+collects every statement of a request (or of an ``inspect_queries()``
+block in a test) together with the line of project code that issued it.
+"""
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+logger = logging.getLogger(__name__)
+
+current_inspection = ContextVar('account_query_inspection', default=None)
+
+PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+WHERE_END = re.compile(r' (?:GROUP BY|ORDER BY|LIMIT|RETURNING|FOR UPDATE) ')
+QUALIFIED_COLUMN = re.compile(r'"(\w+)"\."(\w+)"')
+
+
+class QueryProblems(AssertionError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def indexed_columns():
+    """Table -> columns that lead some index, for every installed model."""
+    columns = defaultdict(set)
+    for model in apps.get_models():
+        meta = model._meta
+        table = columns[meta.db_table]
+        for field in meta.local_fields:
+            if field.primary_key or field.unique or field.db_index:
+                table.add(field.column)
+        leading = [index.fields[0] for index in meta.indexes if index.fields]
+        leading += [fields[0] for fields in meta.unique_together]
+        leading += [constraint.fields[0] for constraint in meta.constraints if getattr(constraint, 'fields', None)]
+        for name in leading:
+            table.add(meta.get_field(name.lstrip('-')).column)
+    return columns
+
+
+def shape(sql):
+    # IN lists differ in length between otherwise identical queries.
+    return PLACEHOLDER_LIST.sub('(...)', sql)
+
+
+def unindexed_tables(sql):
+    """Tables filtered in the WHERE clause on no column that leads an index."""
+    _, found, where = sql.partition(' WHERE ')
+    if not found:
+        return []
+    where = WHERE_END.split(where, 1)[0]
+    filtered = defaultdict(set)
+    for table, column in QUALIFIED_COLUMN.findall(where):
+        filtered[table].add(column)
+    known = indexed_columns()
+    return [
+        f'{table}.{"/".join(sorted(columns))}' for table, columns in filtered.items()
+        if table in known and not columns & known[table]
+    ]
+
+
+def origin():
+    """The innermost frame of project code, skipping this module and installed packages."""
+    root = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and filename != __file__ and 'site-packages' not in filename:
+            return f'{filename[len(root) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return '<unknown>'
+
+
+class Inspection:
+    def __init__(self, label, repeat_threshold=None, slow_ms=None):
+        self.label = label
+        self.repeat_threshold = repeat_threshold or settings.QUERY_INSPECTOR_REPEAT_THRESHOLD
+        self.slow_ms = settings.QUERY_INSPECTOR_SLOW_MS if slow_ms is None else slow_ms
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - start) * 1000, origin()))
+
+    def problems(self):
+        problems = []
+        by_shape = defaultdict(list)
+        for sql, duration, where in self.queries:
+            by_shape[shape(sql)].append((duration, where))
+            for table in unindexed_tables(sql):
+                problems.append(f'unindexed filter on {table}: {sql}\n    at {where}')
+            if duration >= self.slow_ms:
+                problems.append(f'slow {duration:.1f} ms: {sql}\n    at {where}')
+        for sql, calls in by_shape.items():
+            if len(calls) >= self.repeat_threshold:
+                origins = sorted({where for _, where in calls})
+                problems.append(
+                    f'repeated {len(calls)}x ({sum(duration for duration, _ in calls):.1f} ms): {sql}\n'
+                    + '\n'.join(f'    at {where}' for where in origins)
+                )
+        return problems
+
+    def report(self, raise_on_problems=None):
+        problems = self.problems()
+        if not problems:
+            return
+        total = sum(duration for _, duration, _ in self.queries)
+        text = f'{self.label}: {len(self.queries)} queries, {total:.1f} ms\n  ' + '\n  '.join(problems)
+        logger.warning(text)
+        if settings.QUERY_INSPECTOR_RAISE if raise_on_problems is None else raise_on_problems:
+            raise QueryProblems(text)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    inspection = current_inspection.get()
+    if inspection is None:
+        return execute(sql, params, many, context)
+    return inspection(execute, sql, params, many, context)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver; see metrics.install_db_wrapper."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_execute_wrapper)
+
+
+@contextmanager
+def inspect_queries(label='inspect_queries()', raise_on_problems=True, **options):
+    """Inspect the statements run inside the block; by default problems fail the test."""
+    inspection = Inspection(label, **options)
+    token = current_inspection.set(inspection)
+    try:
+        yield inspection
+    finally:
+        current_inspection.reset(token)
+    inspection.report(raise_on_problems)
+
+
+class QueryInspectorMiddleware:
+    """Logs a query report for requests with problems; enabled by QUERY_INSPECTOR."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        inspection = Inspection(f'{request.method} {request.path}')
+        token = current_inspection.set(inspection)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_inspection.reset(token)
+        inspection.report()
+        return response
+
+    async def __acall__(self, request):
+        inspection = Inspection(f'{request.method} {request.path}')
+        token = current_inspection.set(inspection)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_inspection.reset(token)
+        inspection.report()
+        return response
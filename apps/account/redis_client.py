@@ -0,0 +1,15 @@
+import redis
+from django.conf import settings
+
+
+_clients = {}
+
+
+def get_redis():
+    """Client for the Redis instance Celery already uses, or None when REDIS_URL is empty."""
+    url = settings.REDIS_URL
+    if not url:
+        return None
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(url)
+    return _clients[url]
@@ -0,0 +1,186 @@
+"""Read-replica routing with read-your-writes stickiness.
+
+Inside a request, reads go to one of DATABASE_REPLICAS (the same one for
+the whole request) and writes go to the primary. A request stays on the
+primary once it has written, inside a transaction, while it carries the
+pin cookie set after a write, and while its user is pinned because their
+row changed in the last REPLICA_STICKINESS seconds. Reads outside a
+request (Celery tasks, management commands) always use the primary.
+"""
+import random
+from contextvars import ContextVar
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject
+
+from .cache import LRUCache
+from .redis_client import get_redis
+
+
+PIN_COOKIE = 'primary_pin'
+
+current_routing = ContextVar('account_replica_routing', default=None)
+
+
+class Routing:
+    __slots__ = ('request', 'wrote', 'pinned', 'alias', 'user_id')
+
+    def __init__(self, request):
+        self.request = request
+        self.wrote = False
+        # Resolved on the first read that could go to a replica once the user is known.
+        self.pinned = None
+        self.alias = None
+        # Set by identify() while authentication still loads the user.
+        self.user_id = None
+
+
+class UserPins:
+    """User ids whose reads stay on the primary for REPLICA_STICKINESS seconds.
+
+    Kept in Redis so every worker sees them, mirrored in a local LRU so the
+    worker that handled the write needs no round trip.
+    """
+    key_prefix = 'account:replica-pin:'
+
+    def __init__(self):
+        self.local = LRUCache(settings.PROFILE_CACHE_SIZE, settings.REPLICA_STICKINESS)
+
+    def pin(self, user_id):
+        key = str(user_id)
+        self.local.set(key, True)
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(self.key_prefix + key, 1, ex=settings.REPLICA_STICKINESS)
+            except redis.RedisError:
+                pass
+
+    def is_pinned(self, user_id):
+        key = str(user_id)
+        if self.local.get(key):
+            return True
+        client = get_redis()
+        if client is None:
+            return False
+        try:
+            return bool(client.exists(self.key_prefix + key))
+        except redis.RedisError:
+            # Without the shared pins a stale read is possible; the primary never is.
+            return True
+
+
+user_pins = UserPins()
+
+
+def pin_user(user_id):
+    if settings.DATABASE_REPLICAS:
+        user_pins.pin(user_id)
+
+
+def request_user_id(request):
+    # DRF stores the user it authenticated on the HttpRequest; the lazy
+    # session user of AuthenticationMiddleware is never evaluated here.
+    user = request.__dict__.get('user')
+    if user is None or isinstance(user, SimpleLazyObject) or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def identify(user_id):
+    """Name the request's user before request.user is set, so that loading the user row honours their pin."""
+    routing = current_routing.get()
+    if routing is not None:
+        routing.user_id = user_id
+
+
+def is_pinned(routing):
+    if routing.pinned is None:
+        request = routing.request
+        if PIN_COOKIE in request.COOKIES:
+            routing.pinned = True
+            return True
+        user_id = routing.user_id if routing.user_id is not None else request_user_id(request)
+        if user_id is None:
+            # Not cached: the request may still authenticate, and its user may be pinned.
+            return False
+        routing.pinned = user_pins.is_pinned(user_id)
+    return routing.pinned
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        routing = current_routing.get()
+        if not replicas or routing is None or routing.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or is_pinned(routing):
+            return DEFAULT_DB_ALIAS
+        if routing.alias is None:
+            routing.alias = random.choice(replicas)
+        return routing.alias
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        # Explicitly: left to Django, an instance read from a replica would be saved back to it.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Scopes ReplicaRouter to the request and sets the pin cookie after a write."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing = Routing(request)
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin(routing, response)
+
+    async def __acall__(self, request):
+        routing = Routing(request)
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin(routing, response)
+
+    @staticmethod
+    def pin(routing, response):
+        if routing.wrote:
+            # Covers clients without a user yet, e.g. right after registration.
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_STICKINESS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,217 @@
+"""Refresh token revocation without a round trip on the common path.
+
+A refresh token is revoked either by its jti (rotation, logout) or along
+with every other token of its user by bumping the user's token generation
+(password change, account deletion): refresh tokens carry the generation
+that was current when they were issued and older ones are refused.
+
+Redis holds the exact state: a key per revoked jti that expires with the
+token and a counter per user. Every revocation is also appended to a
+stream, from which each process keeps a bloom filter of the jtis and user
+ids revoked within REFRESH_TOKEN_LIFETIME. A refresh whose jti and user
+are both missing from the filter is valid without asking Redis; only
+filter hits (revoked tokens and about 1% false positives) read the exact
+keys. The filter catches up with the stream every
+TOKEN_REVOCATION_SYNC_INTERVAL seconds, which bounds how long a token
+revoked by another worker can still be refreshed. Trimming the stream by
+MINID needs Redis 6.2.
+
+Without REDIS_URL, or while Redis is unreachable, revocations are kept per
+process.
+"""
+import hashlib
+import math
+import threading
+import time
+
+import redis
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+
+from .redis_client import get_redis
+
+
+SYNC_BATCH = 10_000
+
+
+class BloomFilter:
+    """Set of strings that may answer "maybe" for a missing item, but never "no" for a present one."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def lifetime():
+    return api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+
+
+class RevocationList:
+    key_prefix = 'account:revoked:'
+    generation_prefix = 'account:token-generation:'
+    stream_key = 'account:revocations'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Revocations that could not reach Redis: jti -> exp and user id -> generation.
+        self._revoked = {}
+        self._generations = {}
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._revoked.clear()
+            self._generations.clear()
+            self.filter = BloomFilter(settings.TOKEN_REVOCATION_CAPACITY)
+            self._built_at = time.monotonic()
+            self._synced_at = float('-inf')
+            self._stream_id = None
+
+    def _append(self, pipe, member):
+        # Entries older than a refresh token's lifetime can no longer matter.
+        minid = f'{int((time.time() - lifetime()) * 1000)}-0'
+        pipe.xadd(self.stream_key, {'m': member}, minid=minid, approximate=True)
+
+    def revoke(self, jti, exp):
+        """Refuse the token until it expires; False if it already was revoked."""
+        member = f'jti:{jti}'
+        client = get_redis()
+        if client is not None:
+            try:
+                with client.pipeline() as pipe:
+                    pipe.set(self.key_prefix + jti, 1, ex=max(1, int(exp - time.time())), nx=True)
+                    self._append(pipe, member)
+                    added = pipe.execute()[0]
+                with self._lock:
+                    self.filter.add(member)
+                return bool(added)
+            except redis.RedisError:
+                pass
+        with self._lock:
+            if self._revoked.get(jti, 0) > time.time():
+                return False
+            self._revoked[jti] = exp
+            self.filter.add(member)
+        return True
+
+    def revoke_user(self, user_id):
+        """Refuse every refresh token issued to the user so far."""
+        self.revoke_users([user_id])
+
+    def revoke_users(self, user_ids):
+        keys = [str(user_id) for user_id in user_ids]
+        client = get_redis()
+        if client is not None:
+            try:
+                with client.pipeline() as pipe:
+                    for key in keys:
+                        # No expiry: a counter that restarted from 0 would let old tokens through.
+                        pipe.incr(self.generation_prefix + key)
+                        self._append(pipe, f'user:{key}')
+                    pipe.execute()
+                with self._lock:
+                    for key in keys:
+                        self.filter.add(f'user:{key}')
+                return
+            except redis.RedisError:
+                pass
+        with self._lock:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self.filter.add(f'user:{key}')
+
+    def generation(self, user_id):
+        """The generation new refresh tokens of the user are issued with."""
+        key = str(user_id)
+        local = self._generations.get(key, 0)
+        client = get_redis()
+        if client is None:
+            return local
+        try:
+            return max(local, int(client.get(self.generation_prefix + key) or 0))
+        except redis.RedisError:
+            return local
+
+    def is_revoked(self, jti, user_id, generation):
+        self.sync()
+        key = str(user_id)
+        if f'jti:{jti}' not in self.filter and f'user:{key}' not in self.filter:
+            return False
+        if self._revoked.get(jti, 0) > time.time() or self._generations.get(key, 0) > generation:
+            return True
+        client = get_redis()
+        if client is None:
+            return False
+        try:
+            revoked, current = client.mget(self.key_prefix + jti, self.generation_prefix + key)
+        except redis.RedisError:
+            # A hit that cannot be confirmed is refused; the client logs in again.
+            return True
+        return revoked is not None or int(current or 0) > generation
+
+    def sync(self):
+        """Add what other processes revoked since the last sync, rebuilding the filter once it is stale or full."""
+        interval = settings.TOKEN_REVOCATION_SYNC_INTERVAL
+        if time.monotonic() - self._synced_at < interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._synced_at < interval:
+                return
+            self._synced_at = now
+            rebuild = self.filter.count >= settings.TOKEN_REVOCATION_CAPACITY or now - self._built_at > lifetime()
+            bloom, stream_id = (self._local_filter(), None) if rebuild else (self.filter, self._stream_id)
+            client = get_redis()
+            if client is not None:
+                try:
+                    stream_id = self._read(client, bloom, stream_id)
+                except redis.RedisError:
+                    # The current filter stays; a rebuilt one would be missing the stream.
+                    return
+            self.filter, self._stream_id = bloom, stream_id
+            if rebuild:
+                self._built_at = now
+
+    def _local_filter(self):
+        bloom = BloomFilter(settings.TOKEN_REVOCATION_CAPACITY)
+        now = time.time()
+        for jti, exp in list(self._revoked.items()):
+            if exp > now:
+                bloom.add(f'jti:{jti}')
+            else:
+                del self._revoked[jti]
+        for key in self._generations:
+            bloom.add(f'user:{key}')
+        return bloom
+
+    def _read(self, client, bloom, stream_id):
+        while True:
+            entries = client.xrange(
+                self.stream_key, min='-' if stream_id is None else f'({stream_id}', count=SYNC_BATCH
+            )
+            for entry_id, fields in entries:
+                bloom.add(fields[b'm'].decode())
+            if entries:
+                stream_id = entries[-1][0].decode()
+            if len(entries) < SYNC_BATCH:
+                return stream_id
+
+
+revocations = RevocationList()
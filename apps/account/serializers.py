@@ -1,9 +1,22 @@
+from asgiref.sync import sync_to_async
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
-from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
 
-from .tasks import send_activation_code, send_mentor_activation_code
+from .hashers import amake_password
+from .models import ActivationCode, email_lookup
+from .revocation import revocations
+from .tokens import USER_CLAIMS, RefreshToken, add_user_claims
+from .tasks import (
+    send_activation_code,
+    send_mentor_activation_code,
+    send_restore_password_code,
+    send_change_email_code
+)
 
 
 User = get_user_model()
@@ -11,7 +24,7 @@ User = get_user_model()
 
 
 def email_validator(email):
-        if not User.objects.filter(email=email).exists():
+        if not User.objects.with_email(email).exists():
             raise serializers.ValidationError(
                 'User with this email does not exist'
             )
@@ -22,25 +35,29 @@ def email_validator(email):
 class UsersSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = '__all__'
+        fields = ('id', 'email', 'first_name', 'last_name', 'type_of_teach', 'experience', 'audience', 'is_active', 'is_mentor')
 
 
 
-class MentorRegistrationSerialiser(serializers.ModelSerializer):
+class MentorSerializer(serializers.ModelSerializer):
+    """Public card of the mentor directory: no email or account flags."""
+    class Meta:
+        model = User
+        fields = ('id', 'first_name', 'last_name', 'type_of_teach', 'experience', 'audience')
+        read_only_fields = fields
+
+
+
+class UserRegistrationSerializer(serializers.ModelSerializer):
     password_confirm = serializers.CharField(max_length=128, required=True)
+    activation_purpose = ActivationCode.ACTIVATE
 
 
     class Meta:
         model = User
-        fields = ('first_name', 'last_name', 'email', 'type_of_teach', 'experience', 'audience', 'password', 'password_confirm')
-  
-
-    def validate_email(self, email):
-        if User.objects.filter(email=email).exists():
-            raise serializers.ValidationError(
-                'Email already in use'
-            )
-        return email
+        fields = ('first_name', 'last_name', 'email', 'password', 'password_confirm')
+        # Uniqueness is enforced by the email index on INSERT, see create()
+        extra_kwargs = {'email': {'validators': []}}
 
 
     def validate(self, attrs):
@@ -51,40 +68,72 @@ class MentorRegistrationSerialiser(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
-        user.create_activation_code()
-        send_mentor_activation_code.delay(user.email, user.activation_code)
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(**validated_data)
+                code = user.create_activation_code(self.activation_purpose)
+        except IntegrityError:
+            raise serializers.ValidationError({'email': ['Email already in use']})
+        transaction.on_commit(lambda: self.send_activation_code(user.email, code))
         return user
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
-    password_confirm = serializers.CharField(max_length=128, required=True)
+    async def acreate(self, validated_data):
+        # Hash on the executor, then run create() on a database thread:
+        # transaction.atomic() has no async counterpart.
+        password = await amake_password(validated_data.pop('password'))
+        return await sync_to_async(self.create)({**validated_data, 'password': password, 'hashed': True})
 
+    def send_activation_code(self, email, code):
+        send_activation_code.delay(email, code)
 
-    class Meta:
-        model = User
-        fields = ('first_name', 'last_name', 'email', 'password', 'password_confirm')
 
+class MentorRegistrationSerialiser(UserRegistrationSerializer):
+    activation_purpose = ActivationCode.MENTOR_ACTIVATE
 
-    def validate_email(self, email):
-        if User.objects.filter(email=email).exists():
-            raise serializers.ValidationError(
-                'Email already in use'
-            )
-        return email
+
+    class Meta(UserRegistrationSerializer.Meta):
+        fields = ('first_name', 'last_name', 'email', 'type_of_teach', 'experience', 'audience', 'password', 'password_confirm')
+
+    def send_activation_code(self, email, code):
+        send_mentor_activation_code.delay(email, code)
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    token_class = RefreshToken
 
 
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """simplejwt's refresh, with the user claims re-read on every rotation.
+
+    The parent copies them from the old refresh token, so a user made a
+    mentor or staff, or deactivated, would keep the old flags in every
+    access token until logging in again. The row it reads for
+    USER_AUTHENTICATION_RULE now also stamps the new tokens.
+    """
+    token_class = RefreshToken
+
     def validate(self, attrs):
-        password = attrs.get('password')
-        password_confirm = attrs.pop('password_confirm')
-        if password != password_confirm:
-            raise serializers.ValidationError('Passwords do not match')
-        return attrs
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)}
+        ).only(api_settings.USER_ID_FIELD, *USER_CLAIMS).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        add_user_claims(refresh, user)
 
-    def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
-        user.create_activation_code()
-        send_activation_code.delay(user.email, user.activation_code)
-        return user
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class TokenBlacklistSerializer(jwt_serializers.TokenBlacklistSerializer):
+    token_class = RefreshToken
 
 
 class PasswordChangeSerializer(serializers.Serializer):
@@ -111,7 +160,8 @@ class PasswordChangeSerializer(serializers.Serializer):
         user = self.context.get('request').user
         password = self.validated_data.get('new_password')
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['password'])
+        revocations.revoke_user(user.pk)
 
 
 class RestorePasswordSerializer(serializers.Serializer):
@@ -123,25 +173,32 @@ class RestorePasswordSerializer(serializers.Serializer):
 
     def send_code(self):
         email = self.validated_data.get('email')
-        user = User.objects.get(email=email)
-        user.create_activation_code()
-        send_mail(
-            subject='Password restore',
-            message=f'Your code for password restore {user.activation_code}',
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[email]
-        )
+        user = User.objects.with_email(email).get()
+        code = user.create_activation_code(ActivationCode.RESTORE_PASSWORD)
+        send_restore_password_code.delay(email, code)
 
     def send_email_code(self):
         email = self.validated_data.get('email')
-        user = User.objects.get(email=email)
-        user.create_activation_code()
-        send_mail(
-            subject='Change email',
-            message=f'Your code for ghange email {user.activation_code}',
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[email]
-        )
+        user = User.objects.with_email(email).get()
+        code = user.create_activation_code(ActivationCode.CHANGE_EMAIL)
+        send_change_email_code.delay(email, code)
+
+
+class AsyncRestorePasswordSerializer(serializers.Serializer):
+    """RestorePasswordSerializer for the async view.
+
+    The email lookup is awaited in asend_code() instead of running in a
+    validator, since validators are synchronous.
+    """
+    email = serializers.EmailField(required=True, max_length=255)
+
+    async def asend_code(self):
+        email = self.validated_data.get('email')
+        user = await User.objects.with_email(email).only('pk').afirst()
+        if user is None:
+            raise serializers.ValidationError({'email': ['User with this email does not exist']})
+        code = await ActivationCode.objects.aissue(user, ActivationCode.RESTORE_PASSWORD)
+        await sync_to_async(send_restore_password_code.delay, thread_sensitive=False)(email, code)
 
 
 class SetRestoredPasswordSerializer(serializers.Serializer):
@@ -154,13 +211,6 @@ class SetRestoredPasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(max_length=128, required=True)
     new_pass_confirm = serializers.CharField(max_length=128, required=True)
 
-    def validate_code(self, code):
-        if not User.objects.filter(activation_code=code).exists():
-            raise serializers.ValidationError(
-                'Wrong code'
-            )
-        return code
-
     def validate(self, attrs):
         new_password = attrs.get('new_password')
         new_pass_confirm = attrs.get('new_pass_confirm')
@@ -171,12 +221,19 @@ class SetRestoredPasswordSerializer(serializers.Serializer):
         return attrs
         
     def set_new_password(self):
+        # The code is spent by the same statement that sets the password. Hashing
+        # costs what PASSWORD_HASHER is tuned to, so guessed codes are turned away
+        # before paying for it.
         email = self.validated_data.get('email')
-        user = User.objects.get(email=email)
-        new_password = self.validated_data.get('new_password')
-        user.set_password(new_password)
-        user.activation_code = ''
-        user.save()
+        code = self.validated_data.get('code')
+        owner = email_lookup(email)
+        if not ActivationCode.objects.is_spendable(code, ActivationCode.RESTORE_PASSWORD, owner):
+            raise serializers.ValidationError({'code': ['Wrong code']})
+        password = make_password(self.validated_data.get('new_password'))
+        user_id = ActivationCode.objects.redeem(code, ActivationCode.RESTORE_PASSWORD, owner, password=password)
+        if user_id is None:
+            raise serializers.ValidationError({'code': ['Wrong code']})
+        revocations.revoke_user(user_id)
 
 
 class UpdateUsernameImageSerializer(serializers.ModelSerializer):
@@ -190,10 +247,10 @@ class UpdateUsernameImageSerializer(serializers.ModelSerializer):
         fields = ['first_name', 'last_name']
 
     def update(self, instance: User, validated_data):
-        if instance.email == validated_data['user'].email:
+        if instance.pk == validated_data['user'].pk:
             instance.first_name = validated_data.get('first_name', instance.first_name) 
             instance.last_name = validated_data.get('last_name', instance.last_name) 
-            instance.save()
+            instance.save(update_fields=['first_name', 'last_name'])
         else:
             raise serializers.ValidationError('Вы не можете совершить это действие!')
 
@@ -220,13 +277,6 @@ class UpdateEmailSerializer(serializers.ModelSerializer):
     code = serializers.CharField(min_length=1, max_length=8, required=True)
  
 
-    def validate_code(self, code):
-        if not User.objects.filter(activation_code=code).exists():
-            raise serializers.ValidationError(
-                'Wrong code'
-            )
-        return code
-    
 
     def validate(self, attrs):
         new_email = attrs.get('new_email')
@@ -241,6 +291,10 @@ class UpdateEmailSerializer(serializers.ModelSerializer):
     def update(self):
         old_email = self.validated_data.get('old_email')
         new_email = self.validated_data.get('new_email')
-        user_email = User.objects.get(email=old_email)
-        user_email.email = new_email
-        user_email.save()
+        code = self.validated_data.get('code')
+        try:
+            user_id = ActivationCode.objects.redeem(code, ActivationCode.CHANGE_EMAIL, email_lookup(old_email), email=new_email)
+        except IntegrityError:
+            raise serializers.ValidationError({'new_email': ['Email already in use']})
+        if user_id is None:
+            raise serializers.ValidationError({'code': ['Wrong code']})
@@ -0,0 +1,125 @@
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import ActivationCode, User, accounts_deleted, user_changed
+
+
+logger = logging.getLogger(__name__)
+
+
+def process_in_chunks(queryset, label, action, chunk_size=None, pause=None, progress=None):
+    """Run ``action`` over the rows of ``queryset`` in primary-key order, one short transaction per chunk.
+
+    Each chunk resumes after the last id seen (keyset pagination), so no
+    chunk rescans rows handled before, and each transaction holds its locks
+    only for SWEEP_CHUNK_SIZE rows. SWEEP_CHUNK_PAUSE gives replicas time
+    to catch up between chunks. ``action`` gets the chunk as a queryset,
+    still filtered like ``queryset``, and returns how many rows it changed;
+    the sum is returned. ``progress`` gets that count after each chunk commits.
+    """
+    chunk_size = chunk_size or settings.SWEEP_CHUNK_SIZE
+    pause = settings.SWEEP_CHUNK_PAUSE if pause is None else pause
+    last_pk = 0
+    total = 0
+    chunks = 0
+    while True:
+        pks = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not pks:
+            break
+        with transaction.atomic():
+            # Re-filtered under the write: a row may have changed since the read, e.g. been activated.
+            changed = action(queryset.filter(pk__in=pks))
+        total += changed
+        if progress is not None:
+            progress(changed)
+        chunks += 1
+        last_pk = pks[-1]
+        logger.info('Sweep %s: chunk %d, %d rows so far, up to id %d', label, chunks, total, last_pk)
+        if len(pks) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def delete_in_chunks(queryset, label, chunk_size=None, pause=None, progress=None):
+    """Delete the rows of ``queryset`` chunk by chunk, see process_in_chunks(); returns the number deleted."""
+    model_label = queryset.model._meta.label
+    return process_in_chunks(
+        queryset, label, lambda chunk: chunk.delete()[1].get(model_label, 0), chunk_size, pause, progress
+    )
+
+
+def soft_delete_in_chunks(queryset, label, chunk_size=None, pause=None):
+    """User.objects.soft_delete() for many accounts at once, e.g. a whole school, chunk by chunk.
+
+    Their cached profiles are dropped, their refresh tokens revoked and
+    their codes deleted right away.
+    """
+    now = timezone.now()
+
+    def mark(chunk):
+        ids = list(chunk.filter(deleted_at__isnull=True).values_list('pk', flat=True))
+        if ids:
+            User.objects.filter(pk__in=ids).update(is_active=False, deleted_at=now)
+            ActivationCode.objects.filter(user_id__in=ids).delete()
+            accounts_deleted(ids)
+            for user_id in ids:
+                user_changed(user_id)
+        return len(ids)
+
+    return process_in_chunks(queryset, label, mark, chunk_size, pause)
+
+
+def purge_deleted():
+    """Delete the accounts marked by soft_delete() and every row cascading from them.
+
+    Walks the marked users a chunk at a time, so each transaction only
+    covers the dependents of SWEEP_CHUNK_SIZE users. Returns the rows
+    deleted per model.
+    """
+    started = time.perf_counter()
+    stats = Counter()
+
+    def purge(chunk):
+        _, deleted = chunk.delete()
+        stats.update(deleted)
+        return deleted.get(User._meta.label, 0)
+
+    process_in_chunks(User.objects.filter(deleted_at__isnull=False), 'deleted users', purge)
+    seconds = time.perf_counter() - started
+    metrics.count_deletions(
+        purge_runs=1, purge_seconds=seconds, **{f'purged_{label}': count for label, count in stats.items()}
+    )
+    stats = dict(stats, seconds=round(seconds, 3))
+    logger.info('Purge finished: %s', stats)
+    return stats
+
+
+def sweep():
+    """Delete never-activated accounts past UNACTIVATED_ACCOUNT_TTL, then expired codes."""
+    now = timezone.now()
+    started = time.perf_counter()
+    jobs = {
+        'unactivated_users': (User.objects.unactivated(now - settings.UNACTIVATED_ACCOUNT_TTL), 'unactivated users'),
+        'expired_codes': (ActivationCode.objects.filter(expires_at__lte=now), 'expired codes'),
+    }
+    stats = {}
+    for kind, (queryset, label) in jobs.items():
+        # Counted per chunk, so /metrics shows a long run progressing.
+        stats[kind] = delete_in_chunks(
+            queryset, label, progress=lambda count, kind=kind: metrics.count_sweeps(**{f'swept_{kind}': count})
+        )
+    seconds = time.perf_counter() - started
+    metrics.count_sweeps(sweep_runs=1, sweep_seconds=seconds)
+    stats['seconds'] = round(seconds, 3)
+    logger.info('Sweep finished: %s', stats)
+    return stats
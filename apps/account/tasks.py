@@ -1,41 +1,222 @@
-from django.core.mail import send_mail
+import json
+import logging
+from functools import lru_cache
+from smtplib import SMTPException
+
+import redis
+from celery import Task
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from config.celery import app
-from django.conf import settings
 
+from . import sweeper
+from .models import User
+from .redis_client import get_redis
 
 
+ACTIVATION_LINK = 'http://127.0.0.1:8000/account/activate/{}/'
+MENTOR_ACTIVATION_LINK = 'http://127.0.0.1:8000/account/mentor-activate/{}/'
+ACTIVATION_MAIL_QUEUE = 'account:activation-mails'
+ACTIVATION_MAIL_FLUSH_SCHEDULED = 'account:activation-mails:flush-scheduled'
+DEAD_LETTER_MAILS = 'account:dead-letter-mails'
+SWEEP_LOCK = 'account:sweep:lock'
+PURGE_LOCK = 'account:purge:lock'
+PURGE_SCHEDULED = 'account:purge:scheduled'
 
-@app.task
-def send_activation_code(email, activation_code):
-    activation_link = f'http://127.0.0.1:8000/account/activate/{activation_code}/'
-    html_message = render_to_string(
-        'account/code_mail.html', 
-        {'activation_link': activation_link}
-        )
-    send_mail(
+logger = logging.getLogger(__name__)
+
+
+class MailTask(Task):
+    """Retries SMTP and network errors with exponential backoff.
+
+    Once the retries are exhausted the task is logged and parked in a Redis
+    dead-letter list so it can be inspected and re-sent by hand.
+    """
+    autoretry_for = (SMTPException, OSError)
+    retry_backoff = True
+    retry_backoff_max = 600
+    retry_jitter = True
+    max_retries = 5
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        logger.error('Mail task %s[%s] failed permanently: %r', self.name, task_id, exc)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.rpush(DEAD_LETTER_MAILS, json.dumps({
+                'task': self.name,
+                'id': task_id,
+                'args': args,
+                'kwargs': kwargs,
+                'error': repr(exc),
+            }))
+        except redis.RedisError:
+            # The mail failure above is the one that matters; this only loses its parked copy.
+            logger.exception('Could not park %s[%s] in the dead-letter list', self.name, task_id)
+
+
+@lru_cache(maxsize=None)
+def get_code_mail_template():
+    # Compiled once per worker process instead of on every mail.
+    return get_template('account/code_mail.html')
+
+
+def activation_message(email, activation_link):
+    message = EmailMultiAlternatives(
         'Activate your account!',
         '',
         settings.EMAIL_HOST_USER,
-        [email],
-        html_message=html_message,
-        fail_silently=False
+        [email]
+    )
+    message.attach_alternative(
+        get_code_mail_template().render({'activation_link': activation_link}),
+        'text/html'
     )
+    return message
 
 
-@app.task
-def send_mentor_activation_code(email, activation_code):
-    activation_link = f'http://127.0.0.1:8000/account/mentor-activate/{activation_code}/'
-    html_message = render_to_string(
-        'account/code_mail.html', 
-        {'activation_link': activation_link}
-        )
+def send_activation_mails(mails):
+    """Send (email, activation_link) pairs over a single SMTP connection."""
+    get_connection(fail_silently=False).send_messages(
+        [activation_message(email, activation_link) for email, activation_link in mails]
+    )
+
+
+def queue_activation_mail(email, activation_link, eager=False):
+    """Buffer a mail in Redis and make sure a flush is scheduled.
+
+    The first mail of a window schedules flush_activation_mails, the ones
+    arriving before it runs ride along on the same connection.
+    """
+    client = get_redis()
+    if eager or client is None:
+        send_activation_mails([(email, activation_link)])
+        return
+    client.rpush(ACTIVATION_MAIL_QUEUE, json.dumps([email, activation_link]))
+    window = settings.ACTIVATION_MAIL_BATCH_WINDOW
+    if client.set(ACTIVATION_MAIL_FLUSH_SCHEDULED, 1, nx=True, ex=window * 10 + 60):
+        flush_activation_mails.apply_async(countdown=window)
+
+
+def take_activation_mails(client, count):
+    """Pop up to ``count`` queued mails in one MULTI; LPOP with a count would need Redis 6.2."""
+    with client.pipeline() as pipe:
+        pipe.lrange(ACTIVATION_MAIL_QUEUE, 0, count - 1)
+        pipe.ltrim(ACTIVATION_MAIL_QUEUE, count, -1)
+        batch, _ = pipe.execute()
+    return batch
+
+
+@app.task(base=MailTask)
+def flush_activation_mails():
+    client = get_redis()
+    # Cleared before popping: a mail queued from now on schedules its own flush.
+    client.delete(ACTIVATION_MAIL_FLUSH_SCHEDULED)
+    while True:
+        batch = take_activation_mails(client, settings.ACTIVATION_MAIL_BATCH_SIZE)
+        if not batch:
+            return
+        sent = 0
+        try:
+            # One message per call on the shared connection, so a failure
+            # tells exactly which mails were delivered.
+            with get_connection(fail_silently=False) as connection:
+                for item in batch:
+                    connection.send_messages([activation_message(*json.loads(item))])
+                    sent += 1
+        except Exception:
+            # Back to the head of the queue, in order: the failed mail and the ones after it.
+            client.lpush(ACTIVATION_MAIL_QUEUE, *reversed(batch[sent:]))
+            raise
+
+
+@app.task(base=MailTask, bind=True)
+def send_activation_code(self, email, activation_code):
+    queue_activation_mail(email, ACTIVATION_LINK.format(activation_code), eager=self.request.is_eager)
+
+
+@app.task(base=MailTask, bind=True)
+def send_mentor_activation_code(self, email, activation_code):
+    queue_activation_mail(email, MENTOR_ACTIVATION_LINK.format(activation_code), eager=self.request.is_eager)
+
+
+@app.task(base=MailTask)
+def send_activation_codes(recipients, mentor=False):
+    link = MENTOR_ACTIVATION_LINK if mentor else ACTIVATION_LINK
+    send_activation_mails([(email, link.format(activation_code)) for email, activation_code in recipients])
+
+
+@app.task(base=MailTask)
+def send_restore_password_code(email, code):
     send_mail(
-        'Activate your account!',
-        '',
-        settings.EMAIL_HOST_USER,
-        [email],
-        html_message=html_message,
-        fail_silently=False
-    )
\ No newline at end of file
+        subject='Password restore',
+        message=f'Your code for password restore {code}',
+        from_email=settings.EMAIL_HOST_USER,
+        recipient_list=[email]
+    )
+
+
+@app.task(base=MailTask)
+def send_change_email_code(email, code):
+    send_mail(
+        subject='Change email',
+        message=f'Your code for ghange email {code}',
+        from_email=settings.EMAIL_HOST_USER,
+        recipient_list=[email]
+    )
+
+
+def run_exclusively(lock, job, name):
+    client = get_redis()
+    # Beat may fire again before a long run on a large table is done.
+    if client is not None and not client.set(lock, 1, nx=True, ex=settings.SWEEP_LOCK_TIMEOUT):
+        logger.info('%s already running, skipped', name)
+        return None
+    try:
+        return job()
+    finally:
+        if client is not None:
+            client.delete(lock)
+
+
+@app.task
+def sweep_stale_accounts():
+    return run_exclusively(SWEEP_LOCK, sweeper.sweep, 'Sweep')
+
+
+@app.task
+def purge_deleted_accounts():
+    client = get_redis()
+    if client is not None:
+        # Cleared first: an account deleted from now on schedules its own run.
+        client.delete(PURGE_SCHEDULED)
+    return run_exclusively(PURGE_LOCK, sweeper.purge_deleted, 'Purge')
+
+
+@app.task
+def soft_delete_accounts(user_ids):
+    """Soft-delete a chunk of accounts selected across the admin changelist, see UserAdmin.mark_deleted()."""
+    marked = sweeper.soft_delete_in_chunks(User.objects.filter(pk__in=user_ids), 'admin deletion')
+    schedule_purge()
+    return marked
+
+
+def schedule_purge():
+    """Make sure purge_deleted_accounts runs within ACCOUNT_PURGE_DELAY seconds.
+
+    Deletions arriving before it runs share that run. Without Redis (or
+    when it is unreachable) the periodic run in the beat schedule picks
+    the accounts up.
+    """
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        scheduled = client.set(PURGE_SCHEDULED, 1, nx=True, ex=settings.ACCOUNT_PURGE_DELAY * 10 + 60)
+    except redis.RedisError:
+        logger.warning('Purge not scheduled, left to the periodic run', exc_info=True)
+        return
+    if scheduled:
+        purge_deleted_accounts.apply_async(countdown=settings.ACCOUNT_PURGE_DELAY)
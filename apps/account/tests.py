@@ -1,3 +1,1185 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from drf_yasg.generators import OpenAPISchemaGenerator
+from rest_framework_simplejwt import tokens as jwt_tokens
+
+from config.celery import app
+from config.schema import CachedSchemaView
+from . import benchmarks, metrics, urls
+from .hashers import acheck_password
+from .models import ActivationCode, User, email_lookup
+from .profiling import QueryProblems, inspect_queries
+from .replicas import PIN_COOKIE, ReplicaRouter, Routing, current_routing, user_pins
+from .revocation import BloomFilter, revocations
+from .cache import CacheSerializer, profile_cache, user_cache
+from .checks import check_asgi_connections, check_cache_topology, log_topology
+from .tasks import (
+    ACTIVATION_MAIL_QUEUE, flush_activation_mails, purge_deleted_accounts, queue_activation_mail,
+    send_restore_password_code, sweep_stale_accounts,
+)
+from .throttling import SlidingWindowThrottle, sliding_window
+from .tokens import AccessToken, RefreshToken
+
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class ListRedis:
+    """In-memory stand-in for the Redis list and flag commands the activation mail queue uses."""
+
+    def __init__(self):
+        self.lists = {}
+        self.flags = set()
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(value.encode() if isinstance(value, str) else value for value in values)
+
+    def lpush(self, key, *values):
+        for value in values:
+            self.lists.setdefault(key, []).insert(0, value)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.flags:
+            return None
+        self.flags.add(key)
+        return True
+
+    def delete(self, key):
+        self.flags.discard(key)
+
+    def pipeline(self):
+        return ListPipeline(self)
+
+
+class ListPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def lrange(self, key, start, stop):
+        self.commands.append(lambda: list(self.client.lists.get(key, [])[start:stop + 1]))
+
+    def ltrim(self, key, start, stop):
+        def trim():
+            self.client.lists[key] = self.client.lists.get(key, [])[start:]
+        self.commands.append(trim)
+
+    def execute(self):
+        return [command() for command in self.commands]
+
+
+def statements(queries):
+    return [
+        query['sql'] for query in queries
+        if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+    ]
+
+
+class EagerCeleryMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._task_always_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+
+    @classmethod
+    def tearDownClass(cls):
+        app.conf.task_always_eager = cls._task_always_eager
+        super().tearDownClass()
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class RegistrationTests(EagerCeleryMixin, TestCase):
+    data = {
+        'first_name': 'Ivan',
+        'last_name': 'Ivanov',
+        'email': 'ivan@example.com',
+        'password': 'secret-password',
+        'password_confirm': 'secret-password',
+    }
+
+    def test_registration_writes_each_row_once_without_reads(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/account/register/', self.data)
+        self.assertEqual(response.status_code, 201)
+        sql = statements(queries)
+        self.assertEqual(len(sql), 2, sql)
+        self.assertTrue(sql[0].startswith('INSERT INTO "account_user"'))
+        self.assertTrue(sql[1].startswith('INSERT INTO "account_activationcode"'))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/account/activate/', mail.outbox[0].alternatives[0][0])
+
+    def test_duplicate_email_is_rejected_by_the_index(self):
+        User.objects.create_user('Ivan', self.data['email'], 'password')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/account/register/', self.data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'email': ['Email already in use']})
+        self.assertEqual(callbacks, [])
+        self.assertFalse(ActivationCode.objects.exists())
+
+    def test_emails_differing_only_in_case_are_one_account(self):
+        User.objects.create_user('Ivan', self.data['email'], 'password')
+        response = self.client.post('/account/register/', dict(self.data, email='Ivan@Example.COM'))
+        self.assertEqual(response.json(), {'email': ['Email already in use']})
+        with self.assertNumQueries(1):
+            self.assertEqual(User.objects.with_email('IVAN@example.com').get().email, self.data['email'])
+
+    def test_mentor_registration_shares_the_pipeline(self):
+        data = dict(self.data, type_of_teach='online', experience='1+', audience='no aud')
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/account/mentor-register/', data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(statements(queries)), 2)
+        self.assertIn('/account/mentor-activate/', mail.outbox[0].alternatives[0][0])
+        code = ActivationCode.objects.get()
+        self.assertEqual(code.purpose, ActivationCode.MENTOR_ACTIVATE)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class ActivationCodeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password')
+
+    def test_codes_are_stored_hashed_and_redeemed_once(self):
+        code = self.user.create_activation_code(ActivationCode.ACTIVATE)
+        stored = ActivationCode.objects.get()
+        self.assertNotEqual(stored.code_hash, code)
+        self.assertEqual(stored.code_hash, ActivationCode.hash_code(code))
+        self.assertEqual(ActivationCode.objects.redeem(code, ActivationCode.ACTIVATE, is_active=True), self.user.pk)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertIsNotNone(self.user.activated_at)
+        self.assertIsNone(ActivationCode.objects.redeem(code, ActivationCode.ACTIVATE, is_active=True))
+
+    def test_expired_codes_are_rejected(self):
+        code = self.user.create_activation_code(ActivationCode.ACTIVATE)
+        ActivationCode.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(ActivationCode.objects.redeem(code, ActivationCode.ACTIVATE, is_active=True))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+    def test_codes_only_serve_their_purpose(self):
+        code = self.user.create_activation_code(ActivationCode.RESTORE_PASSWORD)
+        self.assertIsNone(ActivationCode.objects.redeem(code, ActivationCode.ACTIVATE, is_active=True))
+        # The failed attempt did not spend it.
+        self.assertEqual(ActivationCode.objects.redeem(code, ActivationCode.RESTORE_PASSWORD), self.user.pk)
+
+
+@override_settings(PASSWORD_HASHERS=['apps.account.hashers.PBKDF2PasswordHasher'], PBKDF2_ITERATIONS=1000, REDIS_URL='')
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True)
+
+    def test_login_rehashes_when_cost_changes(self):
+        with self.settings(PBKDF2_ITERATIONS=2000):
+            response = self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_login_ignores_email_case(self):
+        response = self.client.post('/account/login/', {'email': 'Ivan@Example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_acheck_password_runs_in_the_pool_and_rehashes(self):
+        with self.settings(PBKDF2_ITERATIONS=2000):
+            self.assertFalse(await acheck_password(self.user, 'wrong'))
+            self.assertTrue(await acheck_password(self.user, 'password'))
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class ImportUsersTests(TestCase):
+    def test_import_skips_existing_and_enqueues_mail_in_chunks(self):
+        User.objects.create_user('Old', 'old@example.com', 'password')
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as file:
+            file.write('{"first_name": "Old", "email": "old@example.com"}\n')
+            for i in range(5):
+                file.write(f'{{"first_name": "User{i}", "email": "user{i}@Example.com", "password": "pw{i}"}}\n')
+            file.flush()
+            with mock.patch('apps.account.tasks.send_activation_codes.delay') as delay:
+                call_command('import_users', file.name, batch_size=2, workers=1, email_chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 6)
+        imported = User.objects.get(email='user3@example.com')
+        self.assertTrue(imported.check_password('pw3'))
+        self.assertFalse(imported.is_active)
+        self.assertEqual(ActivationCode.objects.filter(purpose=ActivationCode.ACTIVATE).count(), 5)
+        recipients = [email for call in delay.call_args_list for email, _ in call.args[0]]
+        self.assertEqual(len(recipients), 5)
+        self.assertTrue(all(len(call.args[0]) <= 2 for call in delay.call_args_list))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class CodeMailTests(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        rates = mock.patch.dict(SlidingWindowThrottle.THROTTLE_RATES, {
+            'restore-password-mail_ip': '1000/min',
+            'restore-password-mail_email': '1000/min',
+            'change-email-mail_ip': '1000/min',
+            'change-email-mail_email': '1000/min',
+        })
+        rates.start()
+        self.addCleanup(rates.stop)
+        User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True)
+
+    def test_code_endpoints_only_enqueue(self):
+        # Latency is tracked by the bench_routes command; here the request must not talk SMTP itself.
+        for url, task in (
+            ('/account/restore-password/', 'send_restore_password_code'),
+            ('/account/update-email/', 'send_change_email_code'),
+        ):
+            with mock.patch(f'apps.account.serializers.{task}.delay') as delay, \
+                    mock.patch('apps.account.tasks.send_mail') as send, \
+                    mock.patch('django.core.mail.get_connection') as get_connection:
+                response = self.client.post(url, {'email': 'ivan@example.com'})
+            self.assertEqual(response.status_code, 200)
+            delay.assert_called_once_with('ivan@example.com', mock.ANY)
+            send.assert_not_called()
+            get_connection.assert_not_called()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_exhausted_retries_end_in_dead_letter(self):
+        with mock.patch('apps.account.tasks.send_mail', side_effect=SMTPException('relay down')) as send, \
+                self.assertLogs('apps.account.tasks', 'ERROR') as logs:
+            result = send_restore_password_code.apply(args=['ivan@example.com', 'code'])
+        self.assertEqual(result.state, 'FAILURE')
+        self.assertEqual(send.call_count, send_restore_password_code.max_retries + 1)
+        self.assertIn('failed permanently', logs.output[0])
+
+    def test_dead_letter_errors_do_not_hide_the_mail_failure(self):
+        client = mock.Mock()
+        client.rpush.side_effect = redis.ConnectionError('down')
+        with mock.patch('apps.account.tasks.get_redis', return_value=client), \
+                self.assertLogs('apps.account.tasks', 'ERROR') as logs:
+            send_restore_password_code.on_failure(SMTPException('relay down'), 'task-id', [], {}, None)
+        self.assertIn('failed permanently', logs.output[0])
+        self.assertIn('dead-letter', logs.output[1])
+
+
+@override_settings(ACTIVATION_MAIL_BATCH_WINDOW=2, ACTIVATION_MAIL_BATCH_SIZE=100)
+class ActivationMailQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.client = ListRedis()
+        patcher = mock.patch('apps.account.tasks.get_redis', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mail.outbox = []
+
+    def queue(self, count):
+        for i in range(count):
+            queue_activation_mail(f'user{i}@example.com', f'http://testserver/account/activate/code{i}/')
+
+    def recipients(self):
+        return [message.to[0] for message in mail.outbox]
+
+    def test_a_window_schedules_one_flush(self):
+        with mock.patch.object(flush_activation_mails, 'apply_async') as schedule:
+            self.queue(3)
+        schedule.assert_called_once_with(countdown=2)
+        self.assertEqual(len(self.client.lists[ACTIVATION_MAIL_QUEUE]), 3)
+
+    def test_a_batch_goes_over_one_connection(self):
+        with mock.patch.object(flush_activation_mails, 'apply_async'):
+            self.queue(3)
+        with mock.patch('apps.account.tasks.get_connection', wraps=get_connection) as connect:
+            flush_activation_mails()
+        connect.assert_called_once_with(fail_silently=False)
+        self.assertEqual(self.recipients(), ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+        self.assertEqual(self.client.lists[ACTIVATION_MAIL_QUEUE], [])
+        self.assertNotIn('account:activation-mails:flush-scheduled', self.client.flags)
+
+    def test_a_failed_send_requeues_only_the_undelivered_mails(self):
+        with mock.patch.object(flush_activation_mails, 'apply_async'):
+            self.queue(4)
+        send_messages = locmem.EmailBackend.send_messages
+
+        def relay_drops_user2(backend, messages):
+            if messages[0].to == ['user2@example.com']:
+                raise SMTPException('relay down')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', relay_drops_user2), \
+                self.assertRaises(SMTPException):
+            flush_activation_mails()
+        self.assertEqual(len(self.client.lists[ACTIVATION_MAIL_QUEUE]), 2)
+
+        flush_activation_mails()
+        self.assertEqual(
+            self.recipients(), ['user0@example.com', 'user1@example.com', 'user2@example.com', 'user3@example.com']
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class UserProfileTests(TestCase):
+    def setUp(self):
+        profile_cache.local.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True, is_mentor=True)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def test_profile_hides_password_and_supports_etags(self):
+        response = self.client.get('/account/user/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('password', response.json())
+        self.assertEqual(response.json()['email'], 'ivan@example.com')
+
+        response = self.client.get('/account/user/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_save_invalidates_cached_profile(self):
+        etag = self.client.get('/account/user/')['ETag']
+        self.user.last_name = 'Petrov'
+        self.user.save(update_fields=['last_name'])
+
+        response = self.client.get('/account/user/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['last_name'], 'Petrov')
+
+    def test_cached_profile_is_served_without_queries(self):
+        self.client.get('/account/user/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/account/user/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class StatelessAuthenticationTests(TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True, is_mentor=True)
+
+    def test_login_embeds_user_claims(self):
+        response = self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'password'})
+        token = AccessToken(response.json()['access'])
+        self.assertEqual(token['user_id'], str(self.user.pk))
+        self.assertTrue(token['is_mentor'])
+        self.assertTrue(token['is_active'])
+
+    def test_tokens_without_claims_are_rejected(self):
+        token = jwt_tokens.AccessToken.for_user(self.user)
+        response = self.client.get('/account/user/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_mentor_permission_is_checked_from_claims(self):
+        self.user.is_mentor = False
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(0):
+            response = self.client.get('/account/user/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True)
+
+    def test_login_is_throttled_per_email_before_any_work(self):
+        for _ in range(5):
+            response = self.client.post('/account/login/', {'email': 'Ivan@example.com', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 401)
+        with self.assertNumQueries(0), mock.patch('django.contrib.auth.hashers.check_password') as check:
+            response = self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        check.assert_not_called()
+
+        response = self.client.post('/account/login/', {'email': 'other@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_restore_code_guesses_are_throttled_per_email(self):
+        data = {'email': 'ivan@example.com', 'code': 'guess', 'new_password': 'x', 'new_pass_confirm': 'x'}
+        for _ in range(5):
+            self.assertEqual(self.client.post('/account/set-restored-password/', data).status_code, 400)
+        self.assertEqual(self.client.post('/account/set-restored-password/', data).status_code, 429)
+
+    def test_forged_forwarded_for_does_not_reset_the_ip_limit(self):
+        for i in range(30):
+            self.client.post('/account/login/', {'email': f'user{i}@example.com', 'password': 'wrong'},
+                             HTTP_X_FORWARDED_FOR=f'10.0.0.{i}')
+        response = self.client.post('/account/login/', {'email': 'new@example.com', 'password': 'wrong'},
+                                    HTTP_X_FORWARDED_FOR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+
+    def test_forwarded_for_is_used_behind_a_proxy(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            for i in range(30):
+                self.client.post('/account/login/', {'email': f'user{i}@example.com', 'password': 'wrong'},
+                                 HTTP_X_FORWARDED_FOR='10.0.0.1')
+            response = self.client.post('/account/login/', {'email': 'new@example.com', 'password': 'wrong'},
+                                        HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(response.status_code, 401)
+
+    def test_in_memory_counter_keeps_a_bounded_number_of_keys(self):
+        with mock.patch.object(sliding_window, 'max_keys', 3):
+            for i in range(10):
+                sliding_window.hit(f'key{i}', 1, 60)
+            self.assertEqual(list(sliding_window._hits), ['key7', 'key8', 'key9'])
+            sliding_window.hit('key7', 1, 60)
+            sliding_window.hit('key10', 1, 60)
+            self.assertEqual(list(sliding_window._hits), ['key9', 'key7', 'key10'])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class AsyncViewTests(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        profile_cache.local.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_mentor=True)
+
+    async def test_registration_hashes_off_loop_and_rejects_duplicates(self):
+        data = dict(RegistrationTests.data, email='petr@example.com')
+        response = await self.async_client.post('/account/async/register/', data)
+        self.assertEqual(response.status_code, 201)
+        user = await User.objects.aget(email='petr@example.com')
+        self.assertTrue(user.check_password('secret-password'))
+        self.assertTrue(await ActivationCode.objects.filter(user=user, purpose=ActivationCode.ACTIVATE).aexists())
+
+        response = await self.async_client.post('/account/async/register/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'email': ['Email already in use']})
+
+    async def test_activation_consumes_the_code(self):
+        code = await ActivationCode.objects.aissue(self.user, ActivationCode.MENTOR_ACTIVATE)
+        response = await self.async_client.get(f'/account/async/mentor-activate/{code}/')
+        self.assertEqual(response.status_code, 200)
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertTrue(self.user.is_mentor)
+        response = await self.async_client.get(f'/account/async/mentor-activate/{code}/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_profile_matches_the_sync_view(self):
+        self.user.is_active = True
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = await self.async_client.get('/account/async/user/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], 'ivan@example.com')
+        headers['If-None-Match'] = response['ETag']
+        response = await self.async_client.get('/account/async/user/', headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await self.async_client.get('/account/async/user/')).status_code, 401)
+
+    async def test_restore_password_issues_a_code(self):
+        response = await self.async_client.post('/account/async/restore-password/', {'email': 'ivan@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(await ActivationCode.objects.filter(purpose=ActivationCode.RESTORE_PASSWORD).aexists())
+        response = await self.async_client.post('/account/async/restore-password/', {'email': 'nobody@example.com'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class CodeRedemptionTests(TransactionTestCase):
+    def setUp(self):
+        sliding_window.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password')
+
+    def test_activation_checks_spends_and_updates_without_reads(self):
+        code = self.user.create_activation_code(ActivationCode.ACTIVATE)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/account/activate/{code}/')
+        self.assertEqual(response.status_code, 200)
+        sql = [query for query in statements(queries) if not query.startswith(('BEGIN', 'COMMIT'))]
+        self.assertTrue(all(query.startswith(('DELETE', 'UPDATE', 'WITH')) for query in sql), sql)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_postgresql_statement_spends_the_code_and_updates_its_owner(self):
+        # Compiled on any backend; executing it needs PostgreSQL, see the test below.
+        codes = ActivationCode.objects._spendable('code', ActivationCode.RESTORE_PASSWORD, email_lookup('ivan@example.com'))
+        sql, params = ActivationCode.objects._redeem_sql(codes, connection, {'password': 'hash'})
+        spent, update = sql.split(') UPDATE ', 1)
+        self.assertTrue(spent.startswith('WITH spent AS (DELETE FROM "account_activationcode" WHERE "id" IN (SELECT'), sql)
+        self.assertIn('"deleted_at" IS NULL', spent)
+        self.assertTrue(spent.endswith('RETURNING "user_id"'), sql)
+        self.assertEqual(
+            update,
+            '"account_user" SET "password" = %s FROM spent WHERE "account_user"."id" = spent."user_id" '
+            'RETURNING "account_user"."id"'
+        )
+        self.assertEqual(params[0], ActivationCode.hash_code('code'))
+        self.assertEqual(params[-2:], ('ivan@example.com', 'hash'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'the single-statement path runs on PostgreSQL only')
+    def test_postgresql_redeems_with_one_statement(self):
+        code = self.user.create_activation_code(ActivationCode.ACTIVATE)
+        with CaptureQueriesContext(connection) as queries:
+            user_id = ActivationCode.objects.redeem(code, ActivationCode.ACTIVATE, is_active=True)
+        self.assertEqual(user_id, self.user.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('WITH spent AS (DELETE'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertIsNotNone(self.user.activated_at)
+        self.assertIsNone(ActivationCode.objects.redeem(code, ActivationCode.ACTIVATE, is_active=True))
+
+    def test_parallel_activations_have_exactly_one_winner(self):
+        code = self.user.create_activation_code(ActivationCode.ACTIVATE)
+        clicks = 8
+        barrier = threading.Barrier(clicks)
+
+        def activate(_):
+            # got_request_exception is global, so a client would re-raise another thread's
+            # failure; errors are read from the status code instead.
+            client = Client(raise_request_exception=False)
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    status_code = client.get(f'/account/activate/{code}/').status_code
+                    # SQLite's shared cache fails on a locked table instead of waiting; the
+                    # transaction was rolled back, so the click is simply repeated.
+                    if status_code != 500:
+                        return status_code
+                return status_code
+            finally:
+                connection.close()
+
+        # The retried 500s would otherwise be logged as server errors.
+        with ThreadPoolExecutor(clicks) as pool, mock.patch.object(logging.getLogger('django.request'), 'disabled', True):
+            statuses = sorted(pool.map(activate, range(clicks)))
+        self.assertEqual(statuses, [200] + [404] * (clicks - 1))
+
+    def test_wrong_restore_codes_are_refused_before_hashing(self):
+        data = {'email': 'ivan@example.com', 'code': 'guess', 'new_password': 'x', 'new_pass_confirm': 'x'}
+        with mock.patch('apps.account.serializers.make_password', wraps=make_password) as hash_password:
+            self.assertEqual(self.client.post('/account/set-restored-password/', data).status_code, 400)
+            hash_password.assert_not_called()
+            data['code'] = self.user.create_activation_code(ActivationCode.RESTORE_PASSWORD)
+            self.assertEqual(self.client.post('/account/set-restored-password/', data).status_code, 200)
+            hash_password.assert_called_once_with('x')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('x'))
+
+    def test_email_change_spends_the_code_once(self):
+        User.objects.create_user('Petr', 'petr@example.com', 'password')
+        code = self.user.create_activation_code(ActivationCode.CHANGE_EMAIL)
+        data = {'old_email': 'ivan@example.com', 'new_email': 'petr@example.com', 'new_email_confirm': 'petr@example.com', 'code': code}
+        response = self.client.post('/account/set-new-email/', data)
+        self.assertEqual(response.json(), {'new_email': ['Email already in use']})
+        # The failed UPDATE rolled the DELETE back with it.
+        self.assertTrue(ActivationCode.objects.exists())
+
+        data.update(new_email='ivan@example.org', new_email_confirm='ivan@example.org')
+        self.assertEqual(self.client.post('/account/set-new-email/', data).status_code, 200)
+        self.assertFalse(ActivationCode.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'ivan@example.org')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class RouteBudgetTests(EagerCeleryMixin, TestCase):
+    def test_every_route_is_covered(self):
+        patterns = {str(pattern.pattern) for pattern in urls.urlpatterns}
+        self.assertEqual(patterns, {route.pattern for route in benchmarks.ROUTES})
+
+    def test_every_route_stays_within_its_query_budget(self):
+        for result in benchmarks.run_routes(iterations=3):
+            with self.subTest(result['route']):
+                self.assertLessEqual(result['queries'], result['max_queries'])
+
+
+@override_settings(
+    PASSWORD_HASHERS=['apps.account.hashers.PBKDF2PasswordHasher'], PBKDF2_ITERATIONS=1000, REDIS_URL='',
+    METRICS_ENABLED=True,
+)
+class MetricsTests(TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        profile_cache.local.clear()
+        metrics.registry.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True, is_mentor=True)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines() if not line.startswith('#'))
+
+    def test_login_reports_latency_queries_and_hashing(self):
+        self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'password'})
+        samples = self.scrape()
+        self.assertEqual(samples['http_request_duration_seconds_count{view="token_obtain_pair"}'], '1')
+        self.assertEqual(samples['http_request_duration_seconds_bucket{view="token_obtain_pair",le="+Inf"}'], '1')
+        self.assertEqual(samples['db_queries_total{view="token_obtain_pair"}'], '1')
+        self.assertGreater(float(samples['password_hashing_seconds_total{view="token_obtain_pair"}']), 0)
+
+    async def test_profile_cache_hits_and_misses_are_counted(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        for path in ('/account/user/', '/account/user/', '/account/async/user/'):
+            await self.async_client.get(path, headers=headers)
+        response = await self.async_client.get('/metrics')
+        samples = dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines() if not line.startswith('#'))
+        self.assertEqual(samples['cache_misses_total{view="user"}'], '1')
+        self.assertEqual(samples['cache_hits_total{view="user"}'], '1')
+        self.assertEqual(samples['cache_hits_total{view="async-user"}'], '1')
+        self.assertEqual(samples['db_queries_total{view="async-user"}'], '0')
+
+    def test_endpoint_is_off_by_default_and_limited_to_allowed_addresses(self):
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='127.0.0.1', REMOTE_ADDR='203.0.113.5').status_code, 403)
+
+    def test_pending_deletions_are_counted_once_per_ttl(self):
+        metrics.deletion_counters.clear()
+        self.scrape()
+        with self.assertNumQueries(0):
+            samples = self.scrape()
+        self.assertEqual(samples['account_deletions_pending'], '0')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class QueryInspectorTests(TestCase):
+    def test_repeated_shapes_are_reported_with_their_origin(self):
+        with self.assertLogs('apps.account.profiling', 'WARNING'), self.assertRaises(QueryProblems) as problems:
+            with inspect_queries():
+                for pk in range(3):
+                    User.objects.filter(pk=pk).first()
+        self.assertIn('repeated 3x', str(problems.exception))
+        self.assertIn('apps/account/tests.py', str(problems.exception))
+
+    def test_unindexed_user_filters_are_reported(self):
+        with self.assertLogs('apps.account.profiling', 'WARNING'), self.assertRaises(QueryProblems) as problems:
+            with inspect_queries():
+                User.objects.filter(first_name='Ivan').exists()
+        self.assertIn('unindexed filter on account_user.first_name', str(problems.exception))
+        with inspect_queries():
+            User.objects.filter(email='ivan@example.com', first_name='Ivan').exists()
+
+    def test_slow_queries_are_reported(self):
+        with self.assertLogs('apps.account.profiling', 'WARNING'), self.assertRaises(QueryProblems) as problems:
+            with inspect_queries(slow_ms=0):
+                User.objects.filter(pk=1).exists()
+        self.assertIn('slow', str(problems.exception))
+
+    @override_settings(QUERY_INSPECTOR=True, QUERY_INSPECTOR_RAISE=True)
+    def test_middleware_can_fail_requests(self):
+        with self.settings(QUERY_INSPECTOR_SLOW_MS=0):
+            with self.assertLogs('apps.account.profiling', 'WARNING'), self.assertRaises(QueryProblems):
+                self.client.get('/account/activate/unknown/')
+        self.assertEqual(self.client.get('/account/activate/unknown/').status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='', SWEEP_CHUNK_SIZE=2)
+class SweeperTests(TestCase):
+    def setUp(self):
+        metrics.deletion_counters.clear()
+
+    def test_sweep_removes_stale_accounts_and_expired_codes_in_chunks(self):
+        long_ago = timezone.now() - timedelta(days=30)
+        stale = [User.objects.create_user(f'Stale{i}', f'stale{i}@example.com', 'password') for i in range(5)]
+        User.objects.filter(pk__in=[user.pk for user in stale]).update(date_joined=long_ago)
+        for user in stale:
+            user.create_activation_code(ActivationCode.ACTIVATE)
+        fresh = User.objects.create_user('Fresh', 'fresh@example.com', 'password')
+        live_code = fresh.create_activation_code(ActivationCode.ACTIVATE)
+        active = User.objects.create_user('Active', 'active@example.com', 'password', is_active=True)
+        User.objects.filter(pk=active.pk).update(date_joined=long_ago)
+        expired = active.create_activation_code(ActivationCode.RESTORE_PASSWORD)
+        ActivationCode.objects.filter(user=active).update(expires_at=long_ago)
+
+        with self.assertLogs('apps.account.sweeper', 'INFO') as logs:
+            stats = sweep_stale_accounts.apply().get()
+
+        self.assertEqual(stats['unactivated_users'], 5)
+        self.assertEqual(stats['expired_codes'], 1)
+        self.assertEqual(sum('unactivated users: chunk' in line for line in logs.output), 3)
+        self.assertEqual(set(User.objects.values_list('email', flat=True)), {'fresh@example.com', 'active@example.com'})
+        self.assertTrue(ActivationCode.objects.valid(live_code, ActivationCode.ACTIVATE).exists())
+        self.assertFalse(ActivationCode.objects.valid(expired, ActivationCode.RESTORE_PASSWORD).exists())
+        rendered = metrics.render()
+        self.assertIn('account_sweep_runs_total 1\n', rendered)
+        self.assertIn('account_swept_rows_total{kind="unactivated_users"} 5\n', rendered)
+        self.assertIn('account_swept_rows_total{kind="expired_codes"} 1\n', rendered)
+
+    def test_sweep_spares_accounts_deactivated_after_activation(self):
+        long_ago = timezone.now() - timedelta(days=30)
+        user = User.objects.create_user('Banned', 'banned@example.com', 'password', is_active=True)
+        self.assertIsNotNone(user.activated_at)
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        User.objects.filter(pk=user.pk).update(date_joined=long_ago)
+
+        stats = sweep_stale_accounts.apply().get()
+
+        self.assertEqual(stats['unactivated_users'], 0)
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REDIS_URL='')
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        user_pins.local.clear()
+        self.router = ReplicaRouter()
+
+    def route(self, request):
+        routing = Routing(request)
+        token = current_routing.set(routing)
+        self.addCleanup(current_routing.reset, token)
+        return routing
+
+    def test_reads_go_to_a_replica_until_the_request_writes(self):
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.route(RequestFactory().get('/account/user/'))
+        self.assertEqual(self.router.db_for_read(User), 'replica')
+        self.assertEqual(self.router.db_for_write(User), 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertIs(self.router.allow_migrate('replica', 'account'), False)
+
+    def test_pinned_users_and_cookies_read_from_the_primary(self):
+        user_pins.pin(1)
+        request = RequestFactory().get('/account/user/')
+        request.user = User(pk=1, is_active=True)
+        self.route(request)
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+        request = RequestFactory().get('/account/user/')
+        request.user = User(pk=2, is_active=True)
+        self.route(request)
+        self.assertEqual(self.router.db_for_read(User), 'replica')
+
+        request = RequestFactory().get('/account/user/', HTTP_COOKIE=f'{PIN_COOKIE}=1')
+        self.route(request)
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+
+# The replica alias is the primary itself here: the point is what gets pinned, not where reads land.
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='', DATABASE_REPLICAS=['default'])
+class ReplicaStickinessTests(TestCase):
+    def setUp(self):
+        user_pins.local.clear()
+        profile_cache.local.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True, is_mentor=True)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_own_writes_pin_the_client_and_the_user(self):
+        response = self.client.get('/account/user/', headers=self.headers)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertFalse(user_pins.is_pinned(self.user.pk))
+
+        response = self.client.patch(
+            f'/account/update-first_last-name/{self.user.email}/',
+            {'first_name': 'Petr', 'last_name': 'Petrov'}, content_type='application/json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        self.assertTrue(user_pins.is_pinned(self.user.pk))
+
+
+# Outside TestCase's transaction, where every read goes to the primary anyway.
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='', DATABASE_REPLICAS=['default'])
+class ReplicaAuthenticationTests(TransactionTestCase):
+    def setUp(self):
+        user_pins.local.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_authentication_reads_a_pinned_user_from_the_primary(self):
+        # A read sent to a replica picks one first; pinned requests never do.
+        data = {'old_password': 'wrong', 'new_password': 'secret', 'new_pass_confirm': 'secret'}
+        with mock.patch('apps.account.replicas.random.choice', return_value='default') as to_replica:
+            self.client.post('/account/change-password/', data, headers=self.headers)
+            to_replica.assert_called()
+
+            user_cache.clear()
+            to_replica.reset_mock()
+            user_pins.pin(self.user.pk)
+            response = self.client.post('/account/change-password/', data, headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+            to_replica.assert_not_called()
+
+
+class CacheConfigurationTests(SimpleTestCase):
+    def test_serializer_round_trips_and_compresses_large_values(self):
+        serializer = CacheSerializer()
+        self.assertEqual(serializer.dumps(7), 7)
+        self.assertEqual(serializer.loads(b'7'), 7)
+        small = {'id': 1, 'email': 'ivan@example.com', 'payload': b'\x00\x01'}
+        self.assertEqual(serializer.loads(serializer.dumps(small)), small)
+        self.assertEqual(serializer.dumps(small)[:1], CacheSerializer.MSGPACK)
+        large = ['profile'] * 1000
+        stored = serializer.dumps(large)
+        self.assertEqual(stored[:1], CacheSerializer.COMPRESSED)
+        self.assertLess(len(stored), 1024)
+        self.assertEqual(serializer.loads(stored), large)
+        self.assertEqual(serializer.loads(serializer.dumps({1, 2})), {1, 2})
+
+    @override_settings(
+        DEBUG=False, REDIS_URL='', SESSION_ENGINE='django.contrib.sessions.backends.cache',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    )
+    def test_topology_is_logged_and_per_process_layouts_are_flagged(self):
+        with self.assertLogs('apps.account.checks', 'INFO') as logs:
+            log_topology()
+        self.assertIn("cache 'default': LocMemCache, per process", logs.output[0])
+        self.assertIn('throttles: per process', logs.output[0])
+        messages = {message.id for message in check_cache_topology(None)}
+        self.assertEqual(messages, {'account.W001', 'account.W002', 'account.W003'})
+
+    def test_redis_passwords_are_not_reported(self):
+        with self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://:secret@cache:6379/1'
+        }}):
+            with self.assertLogs('apps.account.checks', 'INFO') as logs:
+                log_topology()
+        report = logs.output[0]
+        self.assertIn('redis://:***@cache:6379/1', report)
+        self.assertNotIn('secret', report)
+
+
+class AsgiConnectionTests(SimpleTestCase):
+    def test_asgi_workers_close_connections_after_each_request(self):
+        script = (
+            'import config.asgi, json\n'
+            'from django.conf import settings\n'
+            'print(json.dumps(settings.DATABASES["default"]["CONN_MAX_AGE"]))'
+        )
+        env = {key: value for key, value in os.environ.items() if key not in ('ASGI', 'DB_CONN_MAX_AGE')}
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout), 0)
+
+    def test_persistent_connections_under_asgi_are_flagged(self):
+        with override_settings(ASGI=False):
+            self.assertEqual(check_asgi_connections(None), [])
+        database = {**settings.DATABASES['default'], 'CONN_MAX_AGE': 60, 'DISABLE_SERVER_SIDE_CURSORS': False}
+        with override_settings(ASGI=True), mock.patch.dict(settings.DATABASES, {'default': database}):
+            self.assertEqual([message.id for message in check_asgi_connections(None)], ['account.W004'])
+            database['DISABLE_SERVER_SIDE_CURSORS'] = True
+            self.assertEqual(check_asgi_connections(None), [])
+
+
+class ApiOnlyProfileTests(SimpleTestCase):
+    def test_api_only_workers_skip_browser_layers(self):
+        script = (
+            'import django, json; django.setup()\n'
+            'from django.conf import settings; from django.urls import resolve, Resolver404\n'
+            'def routed(path):\n'
+            '    try: return resolve(path).url_name\n'
+            '    except Resolver404: return None\n'
+            'print(json.dumps({"apps": settings.INSTALLED_APPS, "middleware": settings.MIDDLEWARE,'
+            ' "context_processors": settings.TEMPLATES[0]["OPTIONS"]["context_processors"],'
+            ' "routes": [routed(path) for path in ("/", "/admin/", "/account/user/")]}))'
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings', 'API_ONLY': 'True'}
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        profile = json.loads(result.stdout)
+        self.assertNotIn('django.contrib.admin', profile['apps'])
+        self.assertNotIn('drf_yasg', profile['apps'])
+        self.assertNotIn('django.contrib.messages', profile['apps'])
+        self.assertNotIn('django.contrib.sessions.middleware.SessionMiddleware', profile['middleware'])
+        self.assertNotIn('django.middleware.csrf.CsrfViewMiddleware', profile['middleware'])
+        self.assertNotIn('django.contrib.messages.middleware.MessageMiddleware', profile['middleware'])
+        self.assertNotIn('django.contrib.auth.context_processors.auth', profile['context_processors'])
+        self.assertNotIn('django.contrib.messages.context_processors.messages', profile['context_processors'])
+        self.assertEqual(profile['routes'], [None, None, 'user'])
+
+
+@override_settings(REDIS_URL='')
+class SchemaTests(TestCase):
+    def test_schema_is_generated_once(self):
+        CachedSchemaView.schemas.clear()
+        with mock.patch.object(
+            OpenAPISchemaGenerator, 'get_schema', autospec=True, side_effect=OpenAPISchemaGenerator.get_schema
+        ) as get_schema:
+            first = self.client.get('/?format=openapi')
+            second = self.client.get('/?format=openapi')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertIn('/user/', first.json()['paths'])
+        self.assertEqual(get_schema.call_count, 1)
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='', ADMIN_COUNT_LIMIT=3,
+    SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'
+)
+class UserAdminTests(TestCase):
+    def setUp(self):
+        profile_cache.local.clear()
+        self.admin = User.objects.create_superuser('Admin', 'admin@example.com', 'password')
+        self.users = [User.objects.create_user(f'User{i}', f'User{i}@Example.com', 'password') for i in range(4)]
+        self.client.force_login(self.admin)
+
+    def test_changelist_trims_columns_and_caps_filtered_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/account/user/', {'q': 'user'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        page = [sql for sql in statements(queries) if sql.startswith('SELECT "account_user"."id", "account_user"."email"')]
+        self.assertEqual(len(page), 1)
+        self.assertNotIn('password', page[0])
+        self.assertIn('LIKE', page[0])
+        self.assertEqual(
+            self.client.get('/admin/account/user/', {'q': str(self.users[0].pk)}).context['cl'].result_count, 1
+        )
+
+    def test_bulk_actions_run_one_update(self):
+        User.objects.filter(pk=self.users[0].pk).update(is_active=True)
+        profile_cache.set(self.users[1].pk, b'{}')
+        selected = [user.pk for user in self.users]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/admin/account/user/', {'action': 'activate', '_selected_action': selected}
+            )
+        self.assertEqual(response.status_code, 302)
+        updates = [sql for sql in statements(queries) if sql.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(User.objects.filter(pk__in=selected, is_active=True).count(), 4)
+        self.assertEqual(User.objects.filter(pk__in=selected[1:], activated_at__isnull=False).count(), 3)
+        self.assertIsNone(profile_cache.local.get(str(self.users[1].pk)))
+
+    @override_settings(SWEEP_CHUNK_SIZE=2)
+    def test_select_across_updates_in_chunks_and_drops_cached_profiles(self):
+        for user in self.users:
+            profile_cache.set(user.pk, b'{}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/admin/account/user/?q=user', {
+                'action': 'make_mentor', 'select_across': '1', 'index': '0',
+                '_selected_action': [self.users[0].pk],
+            })
+        self.assertEqual(response.status_code, 302)
+        updates = [sql for sql in statements(queries) if sql.startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(User.objects.filter(is_mentor=True).count(), 4)
+        for user in self.users:
+            self.assertIsNone(profile_cache.local.get(str(user.pk)))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class MentorDirectoryTests(TestCase):
+    def setUp(self):
+        self.mentors = [
+            User.objects.create_user(
+                f'Mentor{i}', f'mentor{i}@example.com', 'password', last_name='Smith' if i % 2 else 'Jones',
+                is_active=True, is_mentor=True, type_of_teach='online' if i % 2 else 'privat'
+            )
+            for i in range(5)
+        ]
+        User.objects.create_user('Student', 'student@example.com', 'password', is_active=True)
+        User.objects.create_user('Inactive', 'inactive@example.com', 'password', is_mentor=True)
+
+    def test_pages_are_keyset_walks_without_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/account/mentors/', {'page_size': 2})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(statements(queries)), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+        self.assertNotIn('email', first.json()['results'][0])
+        seen = []
+        url, page = first.json()['next'], first.json()
+        while True:
+            seen += [mentor['id'] for mentor in page['results']]
+            if not url:
+                break
+            page = self.client.get(url).json()
+            url = page['next']
+        self.assertEqual(seen, [mentor.pk for mentor in self.mentors])
+
+    def test_filters(self):
+        response = self.client.get('/account/mentors/', {'type_of_teach': 'online', 'name': 'smi'})
+        self.assertEqual(
+            [mentor['id'] for mentor in response.json()['results']], [self.mentors[1].pk, self.mentors[3].pk]
+        )
+        self.assertEqual(len(self.client.get('/account/mentors/', {'name': 'mentor4'}).json()['results']), 1)
+        self.assertEqual(self.client.get('/account/mentors/', {'experience': 'bogus'}).status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='')
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        revocations.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True)
+
+    def login(self):
+        return self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'password'}).json()
+
+    def refresh(self, token):
+        return self.client.post('/account/token/refresh/', {'refresh': token})
+
+    def test_refresh_tokens_rotate_and_are_spent_once(self):
+        first = self.login()['refresh']
+        response = self.refresh(first)
+        self.assertEqual(response.status_code, 200)
+        second = response.json()['refresh']
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.refresh(first).status_code, 401)
+        self.assertEqual(self.refresh(second).status_code, 200)
+
+    def test_rotation_stamps_the_current_user_flags(self):
+        token = self.login()['refresh']
+        User.objects.filter(pk=self.user.pk).update(is_mentor=True, is_staff=True)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        for issued in (AccessToken(response.json()['access']), RefreshToken(response.json()['refresh'])):
+            self.assertTrue(issued['is_mentor'])
+            self.assertTrue(issued['is_staff'])
+
+    def test_deactivated_and_removed_users_cannot_refresh(self):
+        token = self.login()['refresh']
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.refresh(token).status_code, 401)
+        token = RefreshToken.for_user(User.objects.create_user('Petr', 'petr@example.com', 'password', is_active=True))
+        User.objects.filter(email='petr@example.com').delete()
+        self.assertEqual(self.refresh(str(token)).status_code, 401)
+
+    def test_logout_revokes_the_token(self):
+        token = self.login()['refresh']
+        self.assertEqual(self.client.post('/account/logout/', {'refresh': token}).status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_password_change_revokes_every_token(self):
+        tokens = [self.login() for _ in range(2)]
+        response = self.client.post(
+            '/account/change-password/',
+            {'old_password': 'password', 'new_password': 'secret', 'new_pass_confirm': 'secret'},
+            HTTP_AUTHORIZATION=f'Bearer {tokens[0]["access"]}'
+        )
+        self.assertEqual(response.status_code, 200)
+        for token in tokens:
+            self.assertEqual(self.refresh(token['refresh']).status_code, 401)
+        token = self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'secret'}).json()
+        self.assertEqual(self.refresh(token['refresh']).status_code, 200)
+
+    def test_only_filter_hits_reach_redis(self):
+        client = mock.Mock()
+        client.xrange.return_value = []
+        client.mget.return_value = [b'1', None]
+        with mock.patch('apps.account.revocation.get_redis', return_value=client):
+            self.assertFalse(revocations.is_revoked('live', self.user.pk, 0))
+            client.mget.assert_not_called()
+            revocations.filter.add('jti:revoked')
+            self.assertTrue(revocations.is_revoked('revoked', self.user.pk, 0))
+            client.mget.assert_called_once()
+        # Synced once: later checks inside the interval read nothing.
+        client.xrange.assert_called_once()
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1_000)
+        for i in range(1_000):
+            bloom.add(f'jti:{i}')
+        self.assertTrue(all(f'jti:{i}' in bloom for i in range(1_000)))
+        false_positives = sum(f'other:{i}' in bloom for i in range(10_000))
+        self.assertLess(false_positives, 300)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, REDIS_URL='', SWEEP_CHUNK_SIZE=2)
+class AccountDeletionTests(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        sliding_window.clear()
+        revocations.clear()
+        metrics.deletion_counters.clear()
+        self.user = User.objects.create_user('Ivan', 'ivan@example.com', 'password', is_active=True)
+
+    def test_delete_account_marks_the_row_and_spends_its_codes(self):
+        tokens = self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'password'}).json()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(
+                '/account/delete-account/', HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual([sql.split()[0] for sql in statements(queries)], ['UPDATE', 'DELETE'])
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+        response = self.client.post('/account/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_purge_removes_deleted_accounts_and_dependents_in_chunks(self):
+        deleted = [User.objects.create_user(f'Gone{i}', f'gone{i}@example.com', 'password') for i in range(3)]
+        for user in deleted:
+            User.objects.soft_delete(user.pk)
+        kept = self.user.create_activation_code(ActivationCode.RESTORE_PASSWORD)
+
+        with self.assertLogs('apps.account.sweeper', 'INFO') as logs:
+            stats = purge_deleted_accounts.apply().get()
+
+        self.assertEqual(stats['account.User'], 3)
+        self.assertEqual(sum('Sweep deleted users: chunk' in line for line in logs.output), 2)
+        self.assertEqual(list(User.objects.values_list('email', flat=True)), ['ivan@example.com'])
+        self.assertTrue(ActivationCode.objects.valid(kept, ActivationCode.RESTORE_PASSWORD).exists())
+        rendered = metrics.render()
+        self.assertIn('account_deletions_total 3\n', rendered)
+        self.assertIn('account_deletions_pending 0\n', rendered)
+        self.assertIn('account_purged_rows_total{model="account.User"} 3\n', rendered)
+
+    def test_deleted_accounts_cannot_redeem_codes_or_be_looked_up(self):
+        codes = [
+            self.user.create_activation_code(purpose)
+            for purpose in (ActivationCode.RESTORE_PASSWORD, ActivationCode.CHANGE_EMAIL)
+        ]
+        User.objects.soft_delete(self.user.pk)
+
+        self.assertFalse(ActivationCode.objects.exists())
+        data = {'email': 'ivan@example.com', 'code': codes[0], 'new_password': 'x', 'new_pass_confirm': 'x'}
+        self.assertEqual(self.client.post('/account/set-restored-password/', data).status_code, 400)
+        self.assertEqual(self.client.post('/account/restore-password/', {'email': 'ivan@example.com'}).status_code, 400)
+        response = self.client.post('/account/login/', {'email': 'ivan@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(User.objects.with_email('ivan@example.com').exists())
+
+        # A code that outlived the deletion, e.g. issued by a concurrent request, is refused as well.
+        code = ActivationCode.objects.issue(self.user, ActivationCode.RESTORE_PASSWORD)
+        self.assertIsNone(ActivationCode.objects.redeem(code, ActivationCode.RESTORE_PASSWORD, password='!'))
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_admin_deletes_softly_in_chunks(self):
+        admin = User.objects.create_superuser('Admin', 'admin@example.com', 'password')
+        users = [User.objects.create_user(f'Pupil{i}', f'pupil{i}@school.example.com', 'password') for i in range(5)]
+        for user in users:
+            user.create_activation_code(ActivationCode.ACTIVATE)
+        self.client.force_login(admin)
+        actions = self.client.get('/admin/account/user/').context['action_form'].fields['action'].choices
+        self.assertNotIn('delete_selected', dict(actions))
+        profile_cache.set(users[0].pk, b'{}')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/admin/account/user/?q=pupil', {
+                'action': 'mark_deleted', 'select_across': '1', 'index': '0',
+                '_selected_action': [users[0].pk],
+            })
+        self.assertEqual(response.status_code, 302)
+        # Only the ids were read in the request; the workers do the marking, a chunk each.
+        self.assertFalse(User.objects.filter(deleted_at__isnull=False).exists())
+        self.assertEqual(len(callbacks), 3)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(User.objects.filter(deleted_at__isnull=False, is_active=False).count(), 5)
+        self.assertFalse(ActivationCode.objects.exists())
+        self.assertIsNone(profile_cache.local.get(str(users[0].pk)))
+        self.assertIsNone(User.objects.get(pk=admin.pk).deleted_at)
@@ -0,0 +1,52 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .revocation import revocations
+
+
+USER_CLAIMS = ('is_active', 'is_staff', 'is_mentor')
+GENERATION_CLAIM = 'gen'
+
+
+def add_user_claims(token, user):
+    # Lets permissions be checked from the token alone, see StatelessJWTAuthentication.
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class AccessToken(tokens.AccessToken):
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+class RefreshToken(tokens.RefreshToken):
+    """Refresh token that can be revoked, see apps.account.revocation.
+
+    simplejwt calls blacklist() on rotation (BLACKLIST_AFTER_ROTATION) and
+    on logout (TokenBlacklistView); nothing here touches the database.
+    """
+    access_token_class = AccessToken
+    no_copy_claims = (*tokens.RefreshToken.no_copy_claims, GENERATION_CLAIM)
+
+    @classmethod
+    def for_user(cls, user):
+        token = add_user_claims(super().for_user(user), user)
+        token[GENERATION_CLAIM] = revocations.generation(user.pk)
+        return token
+
+    def verify(self):
+        super().verify()
+        # After the signature and expiry checks, so only live tokens are looked up.
+        if revocations.is_revoked(
+            self[api_settings.JTI_CLAIM], self.get(api_settings.USER_ID_CLAIM), self.get(GENERATION_CLAIM, 0)
+        ):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        if not revocations.revoke(self[api_settings.JTI_CLAIM], self['exp']):
+            # A concurrent request rotated or revoked it first: each token is spent once.
+            raise TokenError(_('Token is blacklisted'))
@@ -12,13 +12,20 @@ from .views import (
     NewEmailView,
     SetNewEmailView,
     MentorActivationView,
-    MentorRegistrationView
+    MentorRegistrationView,
+    MentorListView,
+    LoginView
+    )
+from .async_views import (
+    AsyncAccountActivationView,
+    AsyncMentorActivationView,
+    AsyncMentorRegistrationView,
+    AsyncRegistrationView,
+    AsyncRestorePasswordView,
+    AsyncUserView
     )
 
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)   
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenRefreshView
 
 
 
@@ -28,14 +35,23 @@ urlpatterns = [
     path('mentor-register/', MentorRegistrationView.as_view(), name='m-registration'),
     path('activate/<str:activation_code>/', AccountActivationView.as_view(), name='activation'),
     path('mentor-activate/<str:activation_code>/', MentorActivationView.as_view(), name='m-activation'),
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('login/', LoginView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('logout/', TokenBlacklistView.as_view(), name='logout'),
     path('change-password/', ChangePasswordView.as_view(), name='change_password'),
     path('restore-password/',  RestorePasswordView.as_view(), name='restored_password'),
     path('set-restored-password/', SetRestoredPasswordView.as_view(), name='set_restored_password'),
     path('delete-account/', DeleteAccountView.as_view(), name='delete-account'),
-    path('user/', UserView.as_view()),
-    path('update-first_last-name/<str:email>/', UpdateUsernameImageAccountView.as_view()),
-    path('update-email/', NewEmailView.as_view()),
-    path('set-new-email/', SetNewEmailView.as_view()),
+    path('user/', UserView.as_view(), name='user'),
+    path('update-first_last-name/<str:email>/', UpdateUsernameImageAccountView.as_view(), name='update-name'),
+    path('update-email/', NewEmailView.as_view(), name='update-email'),
+    path('set-new-email/', SetNewEmailView.as_view(), name='set-new-email'),
+    path('mentors/', MentorListView.as_view(), name='mentors'),
+    # Async variants of the I/O-bound endpoints, for ASGI servers.
+    path('async/register/', AsyncRegistrationView.as_view(), name='async-registration'),
+    path('async/mentor-register/', AsyncMentorRegistrationView.as_view(), name='async-m-registration'),
+    path('async/activate/<str:activation_code>/', AsyncAccountActivationView.as_view(), name='async-activation'),
+    path('async/mentor-activate/<str:activation_code>/', AsyncMentorActivationView.as_view(), name='async-m-activation'),
+    path('async/restore-password/', AsyncRestorePasswordView.as_view(), name='async-restored-password'),
+    path('async/user/', AsyncUserView.as_view(), name='async-user'),
 ]
\ No newline at end of file
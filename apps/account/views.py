@@ -4,10 +4,23 @@ from django.contrib.auth import get_user_model
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.viewsets import ModelViewSet
 from .permissions import IsMentor
+from .authentication import CachedUserJWTAuthentication
+from .throttling import EmailThrottle, IPThrottle
+from rest_framework_simplejwt.views import TokenObtainPairView
+from django_filters.rest_framework import DjangoFilterBackend
+from .models import ActivationCode
+from .cache import profile_cache
+from .filters import MentorFilter
+from .pagination import MentorCursorPagination
+from .tasks import schedule_purge
 
 from .serializers import (
     UserRegistrationSerializer, 
@@ -17,26 +30,58 @@ from .serializers import (
     UsersSerializer,
     UpdateUsernameImageSerializer,
     UpdateEmailSerializer,
-    MentorRegistrationSerialiser
+    MentorRegistrationSerialiser,
+    MentorSerializer
     )
 
 
 User = get_user_model()
 
 
+def render_profile(user, request=None):
+    serializer = UsersSerializer(instance=user, context={'request': request})
+    return JSONRenderer().render(serializer.data)
+
+
+def profile_response(request, entry):
+    """Answer with the cached (etag, payload) pair, or 304 if the client already has it."""
+    etag, payload = entry
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 class UserView(APIView):
     permission_classes = [IsMentor]
 
     def get(self, request):
-            try:
-                user = User.objects.get(email=request.user.email)
-            except:
+        entry = profile_cache.get(request.user.pk)
+        if entry is None:
+            user = User.objects.filter(pk=request.user.pk).first()
+            if user is None:
                 return Response('Зарегестрируйтесь для выполнения этого действия',
                 status=status.HTTP_404_NOT_FOUND)
-            serializer = UsersSerializer(instance=user, context={'request': request})
-            return Response(serializer.data)
+            entry = profile_cache.set(request.user.pk, render_profile(user, request))
+        return profile_response(request, entry)
     
 
+class MentorListView(ListAPIView):
+    """Public mentor directory: filters on the choice fields, name-prefix search, keyset pages."""
+    serializer_class = MentorSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = MentorFilter
+    pagination_class = MentorCursorPagination
+    authentication_classes = []
+    permission_classes = []
+
+    def get_queryset(self):
+        return User.objects.listed_mentors().only(*MentorSerializer.Meta.fields)
+
+
 class RegistrationView(APIView):
     @swagger_auto_schema(request_body=UserRegistrationSerializer)
     def post(self, request: Request):
@@ -50,7 +95,7 @@ class RegistrationView(APIView):
 
 
 class MentorRegistrationView(APIView):
-    @swagger_auto_schema(request_body=UserRegistrationSerializer)
+    @swagger_auto_schema(request_body=MentorRegistrationSerialiser)
     def post(self, request: Request):
         serializer = MentorRegistrationSerialiser(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -63,15 +108,12 @@ class MentorRegistrationView(APIView):
 
 class AccountActivationView(APIView):
     def get(self, request, activation_code):
-        user = User.objects.filter(activation_code=activation_code).first()
-        if not user:
+        user_id = ActivationCode.objects.redeem(activation_code, ActivationCode.ACTIVATE, is_active=True)
+        if user_id is None:
             return Response(
                 'Страница не найдена...', 
                 status=status.HTTP_404_NOT_FOUND
                 )
-        user.is_active = True
-        user.activation_code = ''
-        user.save()
         return Response(
             'Учетная запись активирована!', 
             status=status.HTTP_200_OK
@@ -80,22 +122,19 @@ class AccountActivationView(APIView):
 
 class MentorActivationView(APIView):
     def get(self, request, activation_code):
-        user = User.objects.filter(activation_code=activation_code).first()
-        if not user:
+        user_id = ActivationCode.objects.redeem(activation_code, ActivationCode.MENTOR_ACTIVATE, is_active=True, is_mentor=True)
+        if user_id is None:
             return Response(
                 'Страница не найдена...', 
                 status=status.HTTP_404_NOT_FOUND
                 )
-        user.is_active = True
-        user.is_mentor = True
-        user.activation_code = ''
-        user.save()
         return Response(
             'Учетная запись активирована! Теперь вы ментор', 
             status=status.HTTP_200_OK
             )
 
 class ChangePasswordView(APIView):
+    authentication_classes = [CachedUserJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request: Request):
@@ -108,7 +147,14 @@ class ChangePasswordView(APIView):
             )
 
 
+class LoginView(TokenObtainPairView):
+    throttle_classes = [IPThrottle, EmailThrottle]
+    throttle_scope = 'login'
+
+
 class RestorePasswordView(APIView):
+    throttle_classes = [IPThrottle, EmailThrottle]
+    throttle_scope = f'{ActivationCode.RESTORE_PASSWORD}-mail'
     def post(self, request: Request):
         serializer = RestorePasswordSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -121,6 +167,8 @@ class RestorePasswordView(APIView):
 
 
 class NewEmailView(APIView):
+    throttle_classes = [IPThrottle, EmailThrottle]
+    throttle_scope = f'{ActivationCode.CHANGE_EMAIL}-mail'
     def post(self, request: Request):
         serializer = RestorePasswordSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -132,6 +180,8 @@ class NewEmailView(APIView):
 
 
 class SetRestoredPasswordView(APIView):
+    throttle_classes = [IPThrottle, EmailThrottle]
+    throttle_scope = ActivationCode.RESTORE_PASSWORD
     def post(self, request: Request):
         serializer = SetRestoredPasswordSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -143,6 +193,8 @@ class SetRestoredPasswordView(APIView):
 
 
 class SetNewEmailView(APIView):
+    throttle_classes = [IPThrottle, EmailThrottle]
+    throttle_scope = ActivationCode.CHANGE_EMAIL
     def post(self, request: Request):
         serializer = UpdateEmailSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -157,8 +209,9 @@ class DeleteAccountView(APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request: Request):
-        username = request.user.username
-        User.objects.get(username=username).delete()
+        # An UPDATE and the DELETE of its codes here; the row and the rest go with purge_deleted_accounts.
+        User.objects.soft_delete(request.user.pk)
+        transaction.on_commit(schedule_purge)
         return Response(
             'Учетная запись удалена.',
             status=status.HTTP_204_NO_CONTENT
@@ -170,7 +223,7 @@ class UpdateUsernameImageAccountView(APIView):
 
     def patch(self, request, email):
         try:
-            obj = User.objects.get(email=email)
+            obj = User.objects.with_email(email).get()
         except:
             return Response('Пользователь с таким первичным ключем отсутствует.',
             status=status.HTTP_404_NOT_FOUND
@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Read by the settings: connection defaults differ under ASGI.
+os.environ.setdefault('ASGI', 'True')
 
 application = get_asgi_application()
+
+from apps.account.checks import log_topology  # noqa: E402, needs the apps loaded above
+
+log_topology()
@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.schedules import crontab
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -16,6 +17,18 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+app.conf.beat_schedule = {
+    'sweep-stale-accounts': {
+        'task': 'apps.account.tasks.sweep_stale_accounts',
+        'schedule': crontab(minute=17, hour=3),
+    },
+    # Catches accounts whose own purge was never scheduled, see apps.account.tasks.schedule_purge.
+    'purge-deleted-accounts': {
+        'task': 'apps.account.tasks.purge_deleted_accounts',
+        'schedule': crontab(minute='*/15'),
+    },
+}
+
 
 @app.task(bind=True)
 def debug_task(self):
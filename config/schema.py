@@ -0,0 +1,44 @@
+"""OpenAPI schema and Swagger UI, left out of the URLconf when API_ONLY is set."""
+from django.conf import settings
+from drf_yasg import openapi
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+from rest_framework.response import Response
+
+from apps.account.cache import LRUCache
+
+
+SchemaView = get_schema_view(
+   openapi.Info(
+      title="SoloEng API",
+      default_version='v1',
+      description="This is SoloEng API",
+      terms_of_service="https://www.google.com/policies/terms/",
+      contact=openapi.Contact(email="info.soloeng@gmail.com"),
+      license=openapi.License(name="SoloEng License"),
+   ),
+   public=True,
+   permission_classes=[permissions.AllowAny],
+)
+
+
+class CachedSchemaView(SchemaView):
+    """Builds the schema on the first request rather than per request.
+
+    The schema is public, so it does not depend on the user; it only
+    depends on the host and scheme it is served under, which drf_yasg
+    writes into it. drf_yasg's own cache_timeout varies on Cookie and
+    Authorization, i.e. it would keep a copy per token.
+    """
+    schemas = LRUCache(16, settings.SCHEMA_CACHE_TIMEOUT)
+
+    def get(self, request, version='', format=None):
+        key = (request.version or version, request.accepted_renderer.format, request.scheme, request.get_host())
+        schema = self.schemas.get(key)
+        if schema is None:
+            schema = super().get(request, version, format).data
+            self.schemas.set(key, schema)
+        return Response(schema)
+
+
+swagger_ui = CachedSchemaView.with_ui('swagger', cache_timeout=0)
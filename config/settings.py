@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+from copy import deepcopy
 from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
 from decouple import config
 import os
@@ -52,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.account.metrics.MetricsMiddleware',
+    'apps.account.profiling.QueryInspectorMiddleware',
+    'apps.account.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +66,26 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Профиль воркера только для API: без админки, документации, сессий, CSRF, сообщений и clickjacking.
+# API аутентифицируется JWT, а DRF и так освобождает свои views от CSRF.
+API_ONLY = config('API_ONLY', cast=bool, default=False)
+if API_ONLY:
+    _BROWSER_APPS = (
+        'django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages',
+        'django.contrib.staticfiles', 'drf_yasg',
+    )
+    _BROWSER_MIDDLEWARE = (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    )
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in _BROWSER_APPS]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in _BROWSER_MIDDLEWARE]
+
+SCHEMA_CACHE_TIMEOUT = config('SCHEMA_CACHE_TIMEOUT', cast=int, default=3600) # секунды жизни собранной OpenAPI схемы в процессе
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -78,6 +103,16 @@ TEMPLATES = [
         },
     },
 ]
+if API_ONLY:
+    # Без AuthenticationMiddleware и сообщений этим процессорам нечего класть в контекст.
+    _BROWSER_CONTEXT_PROCESSORS = (
+        'django.contrib.auth.context_processors.auth',
+        'django.contrib.messages.context_processors.messages',
+    )
+    TEMPLATES[0]['OPTIONS']['context_processors'] = [
+        processor for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+        if processor not in _BROWSER_CONTEXT_PROCESSORS
+    ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
@@ -85,6 +120,9 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Выставляется в config/asgi.py до загрузки настроек
+ASGI = config('ASGI', cast=bool, default=False)
+
 DATABASES = {
     'default': {
         'ENGINE': config('DB_ENGINE'),
@@ -92,10 +130,35 @@ DATABASES = {
         'USER': config('DB_USER'),
         'PORT': config('DB_PORT'),
         'HOST': config('DB_HOST'),
-        'PASSWORD': config('DB_PASSWORD')
+        'PASSWORD': config('DB_PASSWORD'),
+        # Соединение живет между запросами и проверяется перед повторным использованием.
+        # Под ASGI по умолчанию 0: синхронный код там выполняется в потоках, соединения которых
+        # Django не закрывает в конце запроса; переиспользование берет на себя PgBouncer (DB_PGBOUNCER)
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', cast=int, default=0 if ASGI else 60),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', cast=bool, default=True),
+        # PgBouncer в режиме transaction: серверные курсоры не переживают границу транзакции
+        'DISABLE_SERVER_SIDE_CURSORS': config('DB_PGBOUNCER', cast=bool, default=False),
+        'OPTIONS': {},
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    _PSYCOPG3 = find_spec('psycopg') is not None
+    if DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] and _PSYCOPG3:
+        # psycopg 3 готовит запросы на сервере после нескольких выполнений, PgBouncer их не маршрутизирует
+        DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+
+# Реплики только для чтения: те же параметры, что у default, но другой хост (host или host:port через запятую)
+DATABASE_REPLICAS = []
+for _number, _replica in enumerate(filter(None, config('DB_REPLICA_HOSTS', default='').split(',')), 1):
+    _host, _, _port = _replica.strip().partition(':')
+    _alias = f'replica{_number}'
+    DATABASES[_alias] = deepcopy(DATABASES['default'])
+    DATABASES[_alias].update(HOST=_host, PORT=_port or DATABASES['default']['PORT'], TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(_alias)
+DATABASE_ROUTERS = ['apps.account.replicas.ReplicaRouter']
+REPLICA_STICKINESS = config('DB_REPLICA_STICKINESS', cast=int, default=5) # секунды чтения с primary после записи, чтобы реплика догнала
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -114,6 +177,25 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Хеширование паролей: PASSWORD_HASHER выбирает алгоритм для новых паролей,
+# остальные остаются в списке для проверки старых хешей. При смене алгоритма
+# или стоимости пароль перехешируется при следующем входе.
+_PASSWORD_HASHERS = {
+    'argon2': 'apps.account.hashers.Argon2PasswordHasher',
+    'scrypt': 'apps.account.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'apps.account.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2')
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+]
+PBKDF2_ITERATIONS = config('PBKDF2_ITERATIONS', cast=int, default=600_000)
+ARGON2_TIME_COST = config('ARGON2_TIME_COST', cast=int, default=2)
+ARGON2_MEMORY_COST = config('ARGON2_MEMORY_COST', cast=int, default=102_400) # в КиБ
+ARGON2_PARALLELISM = config('ARGON2_PARALLELISM', cast=int, default=8)
+SCRYPT_WORK_FACTOR = config('SCRYPT_WORK_FACTOR', cast=int, default=2 ** 14)
+PASSWORD_HASHING_WORKERS = config('PASSWORD_HASHING_WORKERS', cast=int, default=os.cpu_count() or 1) # потоки для хеширования в async views
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
@@ -148,13 +230,44 @@ EMAIL_PORT = config('EMAIL_PORT', default=587)
 EMAIL_HOST = config('EMAIL_HOST') # какой хост используется для отправки писем
 EMAIL_HOST_PASSWORD = config('EMAIL_PASSWORD') # пароль от почты
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool) # вид соединения для отправки писем
+ACTIVATION_MAIL_BATCH_WINDOW = config('ACTIVATION_MAIL_BATCH_WINDOW', cast=int, default=2) # сколько секунд копить письма активации перед отправкой
+ACTIVATION_MAIL_BATCH_SIZE = config('ACTIVATION_MAIL_BATCH_SIZE', cast=int, default=100) # писем на одно SMTP соединение
 
 AUTH_USER_MODEL = 'account.User'
 
+ACTIVATION_CODE_LIFETIME = timedelta(hours=config('ACTIVATION_CODE_LIFETIME_HOURS', cast=int, default=24)) # время жизни одноразовых кодов
+UNACTIVATED_ACCOUNT_TTL = timedelta(days=config('UNACTIVATED_ACCOUNT_TTL_DAYS', cast=int, default=7)) # после этого неактивированные учетные записи удаляются
+SWEEP_CHUNK_SIZE = config('SWEEP_CHUNK_SIZE', cast=int, default=1000)
+SWEEP_CHUNK_PAUSE = config('SWEEP_CHUNK_PAUSE', cast=float, default=0) # секунды между пачками, чтобы реплики успевали
+SWEEP_LOCK_TIMEOUT = config('SWEEP_LOCK_TIMEOUT', cast=int, default=3600)
+ACCOUNT_PURGE_DELAY = config('ACCOUNT_PURGE_DELAY', cast=int, default=60) # секунды от удаления аккаунта до очистки, удаленные за это время чистятся одним проходом
+ADMIN_COUNT_LIMIT = config('ADMIN_COUNT_LIMIT', cast=int, default=10_000) # выше этого админка показывает оценку числа строк вместо COUNT(*)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.account.authentication.StatelessJWTAuthentication',
+    ),
+    # Без API_ONLY DRF отдает и браузерную страницу API
+    'DEFAULT_RENDERER_CLASSES': (
+        ('rest_framework.renderers.JSONRenderer',) if API_ONLY else
+        ('rest_framework.renderers.JSONRenderer', 'rest_framework.renderers.BrowsableAPIRenderer')
     ),
+    # Сколько обратных прокси стоит перед приложением. При 0 IP клиента берется
+    # из REMOTE_ADDR, а X-Forwarded-For не учитывается, чтобы его нельзя было подделать
+    'NUM_PROXIES': config('NUM_PROXIES', cast=int, default=0),
+    # Лимиты для входа и одноразовых кодов (apps/account/throttling.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': config('THROTTLE_LOGIN_IP', default='30/min'),
+        'login_email': config('THROTTLE_LOGIN_EMAIL', default='5/min'),
+        'restore-password-mail_ip': config('THROTTLE_CODE_MAIL_IP', default='10/hour'),
+        'restore-password-mail_email': config('THROTTLE_CODE_MAIL_EMAIL', default='3/hour'),
+        'restore-password_ip': config('THROTTLE_CODE_IP', default='30/hour'),
+        'restore-password_email': config('THROTTLE_CODE_EMAIL', default='5/hour'),
+        'change-email-mail_ip': config('THROTTLE_CODE_MAIL_IP', default='10/hour'),
+        'change-email-mail_email': config('THROTTLE_CODE_MAIL_EMAIL', default='3/hour'),
+        'change-email_ip': config('THROTTLE_CODE_IP', default='30/hour'),
+        'change-email_email': config('THROTTLE_CODE_EMAIL', default='5/hour'),
+    },
 }
 
 
@@ -162,8 +275,8 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=360),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
-    'ROTATE_REFRESH_TOKENS': False,
-    'BLACKLIST_AFTER_ROTATION': False,
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': True, # RefreshToken.blacklist() пишет в apps.account.revocation, приложение token_blacklist не нужно
     'UPDATE_LAST_LOGIN': False,
 
     'ALGORITHM': 'HS256',
@@ -176,13 +289,16 @@ SIMPLE_JWT = {
 
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
-    'USER_ID_FIELD': 'first_name',
+    'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
     'USER_AUTHENTICATION_RULE': 'rest_framework_simplejwt.authentication.default_user_authentication_rule',
 
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    'AUTH_TOKEN_CLASSES': ('apps.account.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-    'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+    'TOKEN_USER_CLASS': 'apps.account.authentication.TokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'apps.account.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'apps.account.serializers.TokenRefreshSerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'apps.account.serializers.TokenBlacklistSerializer',
 
     'JTI_CLAIM': 'jti',
 
@@ -191,5 +307,61 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
-CELERY_BROKER_URL = 'redis://127.0.0.1'
-CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/0')
+
+# Кеш Django: Redis с пулом соединений (по умолчанию тот же, что у Celery), без адреса - память процесса
+CACHE_URL = config('CACHE_URL', default=REDIS_URL)
+CACHE_COMPRESS_MIN_BYTES = config('CACHE_COMPRESS_MIN_BYTES', cast=int, default=1024) # значения больше сжимаются zlib
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'TIMEOUT': config('CACHE_TIMEOUT', cast=int, default=300),
+            'KEY_PREFIX': 'cache',
+            'OPTIONS': {
+                'serializer': 'apps.account.cache.CacheSerializer',
+                # Параметры redis.ConnectionPool: один пул на процесс
+                'max_connections': config('CACHE_MAX_CONNECTIONS', cast=int, default=50),
+                'socket_connect_timeout': config('CACHE_CONNECT_TIMEOUT', cast=float, default=1),
+                'socket_timeout': config('CACHE_SOCKET_TIMEOUT', cast=float, default=1),
+                'health_check_interval': 30,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# API работает на JWT, сессии нужны только админке: в кеше, а без него - в подписанной cookie, но не в базе
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.cache' if CACHE_URL else 'django.contrib.sessions.backends.signed_cookies'
+)
+
+# Кеш профиля для /account/user/: локальный LRU в каждом процессе + общий Redis
+PROFILE_CACHE_SIZE = config('PROFILE_CACHE_SIZE', cast=int, default=10_000)
+PROFILE_CACHE_LOCAL_TTL = config('PROFILE_CACHE_LOCAL_TTL', cast=int, default=5)
+PROFILE_CACHE_TTL = config('PROFILE_CACHE_TTL', cast=int, default=300)
+
+# Отзыв refresh-токенов: точные данные в Redis, в каждом процессе bloom-фильтр отозванных за REFRESH_TOKEN_LIFETIME
+TOKEN_REVOCATION_CAPACITY = config('TOKEN_REVOCATION_CAPACITY', cast=int, default=100_000) # ~120 КБ на процесс при 1% ложных срабатываний
+TOKEN_REVOCATION_SYNC_INTERVAL = config('TOKEN_REVOCATION_SYNC_INTERVAL', cast=float, default=1) # секунды, пока отзыв из другого процесса может быть не виден
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', cast=int, default=10) # для views, которым нужна полная запись пользователя
+
+# Отчет о повторяющихся, медленных и неиндексированных запросах (для разработки и staging)
+QUERY_INSPECTOR = config('QUERY_INSPECTOR', cast=bool, default=DEBUG)
+QUERY_INSPECTOR_REPEAT_THRESHOLD = config('QUERY_INSPECTOR_REPEAT_THRESHOLD', cast=int, default=2)
+QUERY_INSPECTOR_SLOW_MS = config('QUERY_INSPECTOR_SLOW_MS', cast=float, default=100)
+QUERY_INSPECTOR_RAISE = config('QUERY_INSPECTOR_RAISE', cast=bool, default=False) # падать с QueryProblems, например в тестах
+
+# Эндпоинт /metrics для Prometheus: выключен по умолчанию и отвечает только адресам из списка
+METRICS_ENABLED = config('METRICS_ENABLED', cast=bool, default=False)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1').split(',') # сравнивается с REMOTE_ADDR
+METRICS_PENDING_TTL = config('METRICS_PENDING_TTL', cast=int, default=60) # секунды между COUNT ожидающих удаления аккаунтов
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
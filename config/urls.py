@@ -15,36 +15,28 @@ Including another URLconf
 """
 
 
-from django.contrib import admin
 from django.urls import path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from django.conf.urls.static import static
 from django.conf import settings
-from rest_framework.routers import DefaultRouter
 
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="SoloEng API",
-      default_version='v1',
-      description="This is SoloEng API",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="info.soloeng@gmail.com"),
-      license=openapi.License(name="SoloEng License"),
-   ),
-   public=True,
-   permission_classes=[permissions.AllowAny],
-)
+from apps.account.metrics import metrics_view
 
 
 urlpatterns = [
-    path('', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('admin/', admin.site.urls),
     path('account/', include('apps.account.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
+if not settings.API_ONLY:
+    # Imported here so that API-only workers never load the admin or drf_yasg's views.
+    from django.contrib import admin
+    from .schema import swagger_ui
+
+    urlpatterns += [
+        path('', swagger_ui, name='schema-swagger-ui'),
+        path('admin/', admin.site.urls),
+    ]
+
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file